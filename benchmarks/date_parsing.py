@@ -0,0 +1,56 @@
+"""
+Compare dateutil with the fast ISO-8601 path used by Model.deserialize_date.
+
+python benchmarks/date_parsing.py [timestamps] [distinct]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dateutil.parser  # noqa
+import pytz  # noqa
+
+from python_api_client import dates  # noqa
+
+TIME_ZONE = pytz.timezone('Europe/London')
+
+
+def make_timestamps(count, distinct):
+    start = datetime(2014, 7, 1)
+    return [(start + timedelta(seconds=i % distinct)).strftime('%Y-%m-%dT%H:%M:%S.123456Z') for i in range(count)]
+
+
+def dateutil_parse(value):
+    return dates.localize(dateutil.parser.parse(value), TIME_ZONE)
+
+
+def fast_parse(value):
+    return dates.localize(dates.parse_iso(value), TIME_ZONE)
+
+
+def cached_parse(value):
+    return dates.parse_datetime(value, TIME_ZONE)
+
+
+def timed(func, timestamps):
+    dates._cache.clear()
+    start = time.time()
+    for value in timestamps:
+        func(value)
+    return time.time() - start
+
+
+def main(count=100000, distinct=1000):
+    timestamps = make_timestamps(count, distinct)
+    baseline = None
+    for func in (dateutil_parse, fast_parse, cached_parse):
+        elapsed = timed(func, timestamps)
+        baseline = baseline or elapsed
+        print('%-15s %7.3fs %9.0f/s %6.1fx' % (func.__name__, elapsed, count / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
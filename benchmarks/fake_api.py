@@ -0,0 +1,184 @@
+"""
+A local api for the benchmarks that can be made slow, large or unreliable.
+
+    /api/benchmodels/          GET a page of rows, POST one, PATCH a batch
+    /api/benchmodels/<id>/     GET, PATCH or DELETE one row
+
+Lists honour limit_start / limit_stop and send meta with total_count and next.
+
+python benchmarks/fake_api.py [--port 8002] [--latency 0.01] [--rows 1000] ...
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+ITEM_RE = re.compile(r'^/api/benchmodels/(\d+)/$')
+LIST_PATH = '/api/benchmodels/'
+
+
+class FakeApiConfig(object):
+    """
+    latency - seconds added to every response
+    rows - number of rows in the list
+    payload_size - bytes of padding in each row
+    page_size - rows per page when the request has no limit_stop
+    error_rate / throttle_rate - share of requests answered with a 500 / a 429
+    """
+
+    def __init__(self, latency=0.0, rows=1000, payload_size=100, page_size=100, error_rate=0.0,
+                 throttle_rate=0.0, seed=1):
+        self.latency = latency
+        self.rows = rows
+        self.payload_size = payload_size
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def to_dict(self):
+        return dict((k, v) for k, v in self.__dict__.items() if k not in ('random', 'lock', 'requests'))
+
+    def row(self, i):
+        return {
+            'id': i,
+            'name': 'Bench Model %s' % i,
+            'description': 'x' * self.payload_size,
+            'created': '2014-07-01T12:00:00Z',
+            'score': i * 1.5,
+        }
+
+    def roll(self):
+        """
+        Returns the error status for this request or None
+        """
+        with self.lock:
+            self.requests += 1
+            value = self.random.random()
+        if value < self.error_rate:
+            return 500
+        if value < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+
+class FakeApiHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # buffer each response so it goes out in one write, see handle_one_request
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send(self, status, data=None, headers=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self, method):
+        self._read_body()
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        status = self.config.roll()
+        if status == 429:
+            return self._send(429, {'error': 'Throttled'}, {'Retry-After': '0'})
+        if status == 500:
+            return self._send(500, {'error': 'Injected error', 'traceback': 'None'})
+
+        url = urlparse(self.path)
+        match = ITEM_RE.match(url.path)
+        if match:
+            pk = int(match.group(1))
+            if not 0 < pk <= self.config.rows:
+                return self._send(404, {'error': 'Not found'})
+            if method == 'delete':
+                return self._send(204)
+            return self._send(200, self.config.row(pk))
+        if url.path != LIST_PATH:
+            return self._send(404, {'error': 'Not found'})
+        if method == 'post':
+            return self._send(201, {'id': self.config.rows + 1})
+        if method == 'patch':
+            return self._send(202, {})
+        return self._send(200, self._page(parse_qs(url.query)))
+
+    def _page(self, query):
+        start = int(query.get('limit_start', [0])[0])
+        stop = int(query.get('limit_stop', [start + self.config.page_size])[0])
+        stop = min(stop, self.config.rows)
+        meta = {'total_count': self.config.rows, 'offset': start, 'limit': stop - start, 'next': None}
+        if stop < self.config.rows:
+            meta['next'] = '%s?limit_start=%s&limit_stop=%s' % (LIST_PATH, stop, stop + (stop - start))
+        return {'meta': meta, 'objects': [self.config.row(i) for i in range(start + 1, stop + 1)]}
+
+    def do_GET(self):
+        self._handle('get')
+
+    def do_POST(self):
+        self._handle('post')
+
+    def do_PATCH(self):
+        self._handle('patch')
+
+    def do_DELETE(self):
+        self._handle('delete')
+
+
+class FakeApiServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, config):
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeApiHandler)
+        self.config = config
+
+
+def serve(port=0, **config):
+    """
+    Start a server in a background thread, returns (server, base api url)
+    """
+    server = FakeApiServer(('127.0.0.1', port), FakeApiConfig(**config))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%s/api/' % server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the fake benchmark api')
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--payload-size', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeApiServer(('127.0.0.1', args.port), FakeApiConfig(
+        args.latency, args.rows, args.payload_size, args.page_size, args.error_rate, args.throttle_rate))
+    print('Serving http://127.0.0.1:%s/api/benchmodels/' % args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
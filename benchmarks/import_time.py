@@ -0,0 +1,55 @@
+"""
+Time importing python_api_client.models in fresh interpreters and list the
+heavy modules it loads, so dependencies that should be imported lazily are
+noticed when they creep back in.
+
+python benchmarks/import_time.py [--runs 20] [--module python_api_client.models]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# only imported when they are first needed
+LAZY_MODULES = ('requests', 'pytz', 'dateutil', 'django', 'sqlite3', 'multiprocessing')
+
+SCRIPT = '''
+import json, sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+def measure(module):
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % module], cwd=ROOT)
+    return json.loads(output.decode('utf-8'))
+
+
+def loaded(modules, names=LAZY_MODULES):
+    return sorted(name for name in names if name in modules)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time importing the client')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--module', default='python_api_client.models')
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for i in range(args.runs)]
+    seconds = sorted(run['seconds'] for run in runs)
+    print('import %s' % args.module)
+    print('  min %.1fms  median %.1fms  max %.1fms' % (
+        seconds[0] * 1000, seconds[len(seconds) // 2] * 1000, seconds[-1] * 1000))
+    print('  modules loaded: %s' % len(runs[0]['modules']))
+    heavy = loaded(runs[0]['modules'])
+    print('  lazy modules loaded: %s' % (', '.join(heavy) or 'none'))
+    return 1 if heavy else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Encode and decode throughput of each installed json backend.
+
+python benchmarks/json_codecs.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from python_api_client import codec  # noqa
+
+
+def make_object(i):
+    return {
+        'id': i,
+        'name': 'Model %s' % i,
+        'description': 'Description of model %s' % i,
+        'created': '2014-07-01T12:00:00Z',
+        'active': True,
+        'score': i * 1.5,
+        'tags': ['one', 'two'],
+    }
+
+
+PAYLOADS = {
+    'object': make_object(1),
+    'page': {
+        'meta': {'limit': 100, 'offset': 0, 'total_count': 5000, 'next': '/api/models/?offset=100&limit=100'},
+        'objects': [make_object(i) for i in range(100)],
+    },
+}
+
+
+def timed(func, arg, iterations):
+    start = time.time()
+    for i in range(iterations):
+        func(arg)
+    return time.time() - start
+
+
+def main(iterations=2000):
+    for name, payload in sorted(PAYLOADS.items()):
+        content = codec.load_codec('json').dumps(payload).encode('utf-8')
+        print('%s payload, %s bytes' % (name, len(content)))
+        for backend in codec.available_codecs():
+            encode = timed(backend.dumps, payload, iterations)
+            decode = timed(backend.loads, content, iterations)
+            print('  %-10s encode %9.0f/s %7.1f MB/s   decode %9.0f/s %7.1f MB/s' % (
+                backend.name, iterations / encode, len(content) * iterations / encode / 1e6,
+                iterations / decode, len(content) * iterations / decode / 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
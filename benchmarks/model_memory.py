@@ -0,0 +1,65 @@
+"""
+Compare the memory used by dict based and declared field (__slots__) models.
+
+python benchmarks/model_memory.py [rows]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from python_api_client.models import Model  # noqa
+
+
+class DictModel(Model):
+    pass
+
+
+class SlotsModel(Model):
+    _fields = ('id', 'name', 'description', 'created', 'active')
+
+
+def make_rows(count):
+    return [{
+        'id': i,
+        'name': 'Model %s' % i,
+        'description': 'Description of model %s' % i,
+        'created': '2014-07-01T12:00:00Z',
+        'active': True,
+    } for i in range(count)]
+
+
+def instance_size(instance):
+    """
+    Bytes held by the instance, its attribute dict and its change tracking snapshot.
+    The attribute values are shared by both models so are not counted.
+    """
+    size = sys.getsizeof(instance)
+    if hasattr(instance, '__dict__'):
+        size += sys.getsizeof(instance.__dict__)
+    snapshot = getattr(instance, '_snapshot', None)
+    if snapshot is not None:
+        size += sys.getsizeof(snapshot)
+    return size
+
+
+def measure(model, rows):
+    # the dict model keeps the api dict as _initial_data, count it as it is held
+    instances = [model().deserialize(dict(row)) for row in rows]
+    total = sum(instance_size(instance) for instance in instances)
+    if model._fields is None:
+        total += sum(sys.getsizeof(instance._initial_data) for instance in instances)
+    return total
+
+
+def main(count=100000):
+    rows = make_rows(count)
+    results = [(model.__name__, measure(model, rows)) for model in (DictModel, SlotsModel)]
+    baseline = results[0][1]
+    for name, total in results:
+        print('%-10s %8.1f MB %6.1f bytes/row %5.1f%%' % (
+            name, total / 1024.0 / 1024.0, float(total) / count, 100.0 * total / baseline))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,213 @@
+"""
+Client scenarios run against the fake api, results are written as json so
+runs on different commits can be compared.
+
+python benchmarks/scenarios.py [--output results.json] [--latency 0.005] [--rows 2000] [scenario ...]
+python benchmarks/scenarios.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fake_api import serve  # noqa
+from python_api_client import resilience  # noqa
+from python_api_client.models import Model  # noqa
+from python_api_client.session import SessionPool  # noqa
+
+API_URL = None
+
+
+class BenchModel(Model):
+    _can_save = True
+
+    @classmethod
+    def url(cls):
+        return '%sbenchmodels/' % API_URL
+
+
+class BenchFieldsModel(BenchModel):
+    _fields = ('id', 'name', 'description', 'created', 'score')
+
+
+class BatchBenchModel(BenchModel):
+    _batch_writes = True
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def timings(values):
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+    }
+
+
+def resource(model, pool):
+    rs = model.objects.get_resource()
+    rs._pool = pool
+    return rs
+
+
+def get_latency(pool, server, iterations=200):
+    values = []
+    for i in range(iterations):
+        start = time.time()
+        resource(BenchModel, pool).get(pk=i % server.config.rows + 1)
+        values.append(time.time() - start)
+    return {'latency': timings(values), 'requests_per_second': iterations / sum(values)}
+
+
+def filter_iteration(pool, server):
+    start = time.time()
+    count = sum(1 for instance in resource(BenchModel, pool).all())
+    elapsed = time.time() - start
+    return {'rows': count, 'seconds': elapsed, 'rows_per_second': count / elapsed}
+
+
+def deserialize(pool, server, iterations=5):
+    data_list = [server.config.row(i) for i in range(1, server.config.rows + 1)]
+    result = {}
+    for model in (BenchModel, BenchFieldsModel):
+        start = time.time()
+        for i in range(iterations):
+            model.deserialize_many(data_list)
+        elapsed = time.time() - start
+        result[model.__name__] = {'rows_per_second': len(data_list) * iterations / elapsed}
+    return result
+
+
+def bulk_writes(pool, server, size=200):
+    result = {}
+    for model in (BenchModel, BatchBenchModel):
+        instances = [model().deserialize({'name': 'New %s' % i}) for i in range(size)]
+        start = time.time()
+        report = resource(model, pool).bulk_create(instances)
+        elapsed = time.time() - start
+        result[model.__name__] = {'instances': size, 'failed': len(report.failed), 'seconds': elapsed,
+                                  'instances_per_second': size / elapsed}
+    return result
+
+
+def fan_out(pool, server, size=200):
+    result = {}
+    for workers in (1, 10, 50):
+        start = time.time()
+        fetched = resource(BenchModel, pool).in_bulk(range(1, size + 1), max_workers=workers)
+        elapsed = time.time() - start
+        result['workers_%s' % workers] = {'fetched': len(fetched), 'seconds': elapsed,
+                                         'requests_per_second': size / elapsed}
+    return result
+
+
+def unreliable(pool, server, iterations=200):
+    """
+    gets while the api fails or throttles a share of requests, with retries
+    """
+    server.config.error_rate, server.config.throttle_rate = 0.05, 0.05
+    failed = 0
+    start = time.time()
+    sent = server.config.requests
+    try:
+        for i in range(iterations):
+            try:
+                resource(BenchModel, pool).get(pk=i % server.config.rows + 1)
+            except Exception:
+                failed += 1
+    finally:
+        server.config.error_rate, server.config.throttle_rate = 0.0, 0.0
+    return {'iterations': iterations, 'failed': failed, 'seconds': time.time() - start,
+            'requests_sent': server.config.requests - sent}
+
+
+SCENARIOS = (get_latency, filter_iteration, deserialize, bulk_writes, fan_out, unreliable)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+def run(names=None, **config):
+    global API_URL
+    server, API_URL = serve(**config)
+    resilience.configure(retry_policy=resilience.RetryPolicy(max_retries=3, backoff=0.001),
+                         breakers=resilience.CircuitBreakers(failure_threshold=1000))
+    pool = SessionPool(pool_maxsize=64)
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'time': time.time(),
+        'config': server.config.to_dict(),
+        'scenarios': {},
+    }
+    try:
+        for scenario in SCENARIOS:
+            if not names or scenario.__name__ in names:
+                results['scenarios'][scenario.__name__] = scenario(pool, server)
+    finally:
+        pool.close()
+        server.shutdown()
+    return results
+
+
+def flatten(data, prefix=''):
+    values = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, '%s%s.' % (prefix, key)))
+        elif isinstance(value, (int, float)):
+            values['%s%s' % (prefix, key)] = value
+    return values
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = flatten(json.load(f)['scenarios'])
+    with open(after_path) as f:
+        after = flatten(json.load(f)['scenarios'])
+    for key in sorted(set(before) & set(after)):
+        change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0
+        print('%-50s %12.4f %12.4f %+7.1f%%' % (key, before[key], after[key], change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the client benchmark scenarios')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, all by default')
+    parser.add_argument('--output', help='write the json results here instead of stdout')
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--payload-size', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare)
+
+    results = run(args.scenarios, latency=args.latency, rows=args.rows, payload_size=args.payload_size,
+                  page_size=args.page_size)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
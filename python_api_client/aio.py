@@ -0,0 +1,92 @@
+"""
+Non-blocking counterpart of ResourceSet.
+
+Calls are handed to a shared pool of worker threads and return an
+AsyncResult (see multiprocessing.pool) straight away, so one caller can keep
+many api requests in flight. Requests still go through ResourceSet.send so url
+building, error mapping and deserialization are the same as the blocking api.
+
+This is not event loop i/o, each request in flight holds a worker thread, so
+at most configure(workers=...) requests run at once and the rest queue.
+"""
+import threading
+
+from .resource import ResourceSet
+
+ASYNC_WORKERS = 64
+
+_workers = ASYNC_WORKERS
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            from multiprocessing.pool import ThreadPool
+            _worker_pool = ThreadPool(_workers)
+    return _worker_pool
+
+
+def configure(workers=ASYNC_WORKERS):
+    """
+    Set the number of worker threads, ie the most requests in flight at once.
+    Calls already submitted finish on the old pool.
+    """
+    global _workers, _worker_pool
+    with _worker_pool_lock:
+        _workers = workers
+        old_pool, _worker_pool = _worker_pool, None
+    if old_pool is not None:
+        old_pool.close()
+
+
+def gather(results, timeout=None):
+    """
+    Wait for a list of AsyncResults and return their values in order
+    """
+    return [result.get(timeout) for result in results]
+
+
+class AsyncResourceSet(ResourceSet):
+    """
+    ResourceSet whose a* methods return an AsyncResult instead of blocking.
+
+    Each call runs on its own clone so concurrent calls on one set do not
+    share cache state.
+    """
+
+    def _submit(self, method, *args, **kwargs):
+        callback = kwargs.pop('callback', None)
+        func = getattr(self._clone(), method)
+        return get_worker_pool().apply_async(func, args, kwargs, callback)
+
+    def aget(self, *args, **kwargs):
+        return self._submit('get', *args, **kwargs)
+
+    def afetch(self, **kwargs):
+        """
+        Evaluate the set in the background, the result is the list of instances
+        """
+        callback = kwargs.pop('callback', None)
+        clone = self._clone(kwargs.pop('token', None), kwargs.pop('client', None))
+        return get_worker_pool().apply_async(list, (clone,), {}, callback)
+
+    def asave(self, instance, **kwargs):
+        return self._submit('save', instance, **kwargs)
+
+    def apatch(self, instance, **kwargs):
+        return self._submit('patch', instance, **kwargs)
+
+    def adelete(self, instance, **kwargs):
+        return self._submit('delete', instance, **kwargs)
+
+    def pages(self, **kwargs):
+        """
+        Yield a list of instances per page of results, the next page is
+        fetched while the current one is used. Waiting for a page blocks the
+        caller, use afetch() to evaluate the whole set in the background.
+        """
+        for data_list in self._pages(**kwargs):
+            yield self._deserialize_many(data_list)
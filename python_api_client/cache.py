@@ -0,0 +1,269 @@
+"""
+Response cache for ResourceSet GET requests.
+
+Responses are cached for models with a _cache_ttl. Entries are keyed on the
+method, url, query params and a hash of the auth token. Once an entry is
+stale it is revalidated with If-None-Match / If-Modified-Since so an
+unchanged resource only costs a 304.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import six
+from six.moves.urllib.parse import urlencode
+
+from . import codec
+
+MAX_ENTRIES = 1000
+MAX_BYTES = 10 * 1024 * 1024
+
+CACHED_HEADERS = ['content-type', 'etag', 'last-modified']
+
+
+def make_key(method, url, params=None, token=None):
+    """
+    Key for a request, the token is hashed so it is not kept in the cache
+    """
+    key = '%s %s' % (method.upper(), url)
+    if params:
+        key = '%s?%s' % (key, urlencode(sorted(params.items())))
+    if token:
+        if isinstance(token, six.text_type):
+            token = token.encode('utf-8')
+        key = '%s %s' % (key, hashlib.sha1(token).hexdigest())
+    return key
+
+
+class CachedResponse(object):
+    """
+    The parts of a requests.Response that ResourceSet uses
+    """
+
+    def __init__(self, url, status_code, headers, content):
+        from requests.structures import CaseInsensitiveDict
+
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self, **kwargs):
+        return codec.loads(self.content)
+
+
+class CacheEntry(object):
+
+    def __init__(self, url, status_code, headers, content, ttl):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.size = len(content) + sum(len(k) + len(v) for k, v in headers.items())
+        self.refresh(ttl)
+
+    @classmethod
+    def from_response(cls, url, response, ttl):
+        headers = dict((k, response.headers[k]) for k in CACHED_HEADERS if k in response.headers)
+        return cls(url, response.status_code, headers, response.content, ttl)
+
+    def refresh(self, ttl):
+        self.expires = time.time() + ttl
+
+    def is_fresh(self):
+        return time.time() < self.expires
+
+    def can_revalidate(self):
+        return 'etag' in self.headers or 'last-modified' in self.headers
+
+    def revalidation_headers(self):
+        headers = {}
+        if 'etag' in self.headers:
+            headers['If-None-Match'] = self.headers['etag']
+        if 'last-modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['last-modified']
+        return headers
+
+    def to_response(self):
+        return CachedResponse(self.url, self.status_code, self.headers, self.content)
+
+
+class MemoryCache(object):
+    """
+    In process LRU cache limited by number of entries and total bytes.
+
+    get() returns stale entries that can be revalidated, stale entries that
+    can't are dropped.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if not entry.is_fresh() and not entry.can_revalidate():
+                self.size -= entry.size
+                return None
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry.size
+            self._entries[key] = entry
+            self.size += entry.size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self._entries.popitem(last=False)[1].size
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def invalidate(self, url):
+        """
+        Remove every entry for url or any url below it
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.url.startswith(url):
+                    self.size -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SqliteCache(object):
+    """
+    Cache stored in a sqlite file so every process on a host shares it.
+
+    Responses are stored as their raw bytes with the few headers we need, so a
+    hit is deserialized the same way as a MemoryCache hit. Eviction is least
+    recently used, limited by number of entries and total bytes.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, timeout=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads or across a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            import sqlite3
+
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, url TEXT, status_code INTEGER, headers TEXT, content BLOB, '
+                'size INTEGER, expires REAL, last_used REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @property
+    def size(self):
+        return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT url, status_code, headers, content, expires FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        url, status_code, headers, content, expires = row
+        entry = CacheEntry(url, status_code, json.loads(headers), bytes(content), 0)
+        entry.expires = expires
+        if not entry.is_fresh() and not entry.can_revalidate():
+            self.delete(key)
+            return None
+        connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        return entry
+
+    def set(self, key, entry):
+        import sqlite3
+
+        if entry.size > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, entry.url, entry.status_code, json.dumps(entry.headers), sqlite3.Binary(entry.content),
+                 entry.size, entry.expires, time.time()))
+            count, size = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            if count > self.max_entries or size > self.max_bytes:
+                rows = connection.execute('SELECT key, size FROM responses ORDER BY last_used, rowid').fetchall()
+                evict = []
+                for old_key, old_size in rows:
+                    if count <= self.max_entries and size <= self.max_bytes:
+                        break
+                    evict.append((old_key,))
+                    count -= 1
+                    size -= old_size
+                connection.executemany('DELETE FROM responses WHERE key = ?', evict)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def invalidate(self, url):
+        self._connection().execute('DELETE FROM responses WHERE substr(url, 1, ?) = ?', (len(url), url))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM responses')
+
+
+_default_cache = MemoryCache()
+
+
+def get_default_cache():
+    return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Replace the cache used by ResourceSets that are not given one, any object
+    with get, set, delete, invalidate and clear methods can be used.
+    """
+    global _default_cache
+    _default_cache = cache
+    return cache
@@ -0,0 +1,111 @@
+"""
+Clients hold everything a ResourceSet needs to talk to one api as one user:
+the base url, auth, and the session pool, cache, retry policy, circuit
+breakers and limits its requests go through.
+
+A Client can't be changed after it is made, so one can be shared by any
+number of threads. with_token() and replace() return a new client sharing
+the original's pool, cache and limits, so a client per tenant or per request
+is cheap and every tenant uses the same keep-alive connections. Components
+left as None use the process defaults.
+"""
+FIELDS = ('base_url', 'token', 'headers', 'pool', 'cache', 'retry_policy', 'circuit_breakers', 'limits')
+
+
+class Client(object):
+    """
+    base_url - replaces the settings' BASE_API_URL at the start of model urls
+    token - sent as a JWT AUTHORIZATION header
+    headers - sent with every request, eg {'X-Tenant': 'acme'}
+    pool, cache, retry_policy, circuit_breakers, limits - see session, cache,
+        resilience and limits
+    """
+    __slots__ = ('base_url', 'token', '_headers', 'pool', 'cache', 'retry_policy', 'circuit_breakers', 'limits',
+                 'auth_key')
+
+    def __init__(self, base_url=None, token=None, headers=None, pool=None, cache=None, retry_policy=None,
+                 circuit_breakers=None, limits=None):
+        headers = tuple(sorted((headers or {}).items()))
+        values = {
+            'base_url': base_url,
+            'token': token,
+            '_headers': headers,
+            'pool': pool,
+            'cache': cache,
+            'retry_policy': retry_policy,
+            'circuit_breakers': circuit_breakers,
+            'limits': limits,
+            # what responses are cached and coalesced under, clients with other auth never share them
+            'auth_key': repr((token, headers)) if headers else token,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Client is immutable, use replace() to make a changed copy')
+
+    def __delattr__(self, name):
+        raise AttributeError('Client is immutable, use replace() to make a changed copy')
+
+    def __repr__(self):
+        return '<Client %s%s>' % (self.base_url or 'default url', ' with token' if self.token else '')
+
+    @property
+    def headers(self):
+        return dict(self._headers)
+
+    def replace(self, **changes):
+        """
+        A new client with changes, everything else is shared with this one
+        """
+        values = dict((name, getattr(self, name)) for name in FIELDS)
+        for name in changes:
+            if name not in values:
+                raise TypeError('Client has no %s' % name)
+        values.update(changes)
+        return Client(**values)
+
+    def with_token(self, token):
+        if token == self.token:
+            return self
+        return self.replace(token=token)
+
+    def url(self, model):
+        """
+        The model's url with base_url in place of the settings' BASE_API_URL
+        """
+        url = model.url()
+        if self.base_url is None:
+            return url
+        base = '%s' % model.get_settings().BASE_API_URL
+        if url.startswith(base):
+            return self.base_url + url[len(base):]
+        return url
+
+    def request_headers(self, headers=None):
+        """
+        The client's headers and auth added to a copy of headers
+        """
+        result = dict(self._headers)
+        if headers:
+            result.update(headers)
+        if self.token:
+            result['AUTHORIZATION'] = 'JWT %s' % self.token
+        return result
+
+
+_default_client = Client()
+
+
+def get_default_client():
+    return _default_client
+
+
+def configure(**kwargs):
+    """
+    Replace the process wide client used by models that are not bound to one.
+    Accepts the same arguments as Client.
+    """
+    global _default_client
+    _default_client = Client(**kwargs)
+    return _default_client
@@ -0,0 +1,83 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+While a request is in flight, identical requests from other threads wait for
+it instead of hitting the api again. Each waiting caller gets its own copy of
+the response so the instances deserialized from it are not shared.
+"""
+import sys
+import threading
+
+import six
+
+from .cache import CachedResponse
+
+
+def share_response(response):
+    shared = CachedResponse(response.url, response.status_code, response.headers, response.content)
+    shared.from_cache = getattr(response, 'from_cache', False)
+    shared.coalesced = True
+    return shared
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs one call per key at a time, callers with the same key that arrive
+    while it is running share its response or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.requests += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                six.reraise(*call.error)
+            return share_response(call.response)
+
+        try:
+            call.response = func(*args, **kwargs)
+            return call.response
+        except Exception:
+            call.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def get_stats(self):
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls),
+        }
+
+
+_default_group = SingleFlight()
+
+
+def get_default_group():
+    return _default_group
@@ -0,0 +1,88 @@
+"""
+JSON encoding and decoding used for every request and response.
+
+The backend can be the stdlib json module or a faster drop in, orjson, ujson
+or simplejson, if it is installed.
+"""
+import json
+
+BACKENDS = ('orjson', 'ujson', 'simplejson', 'json')
+
+
+class Codec(object):
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return '<Codec %s>' % self.name
+
+
+def load_codec(name):
+    """
+    Returns the Codec for a backend name, raises ImportError if it is not installed
+    """
+    if name == 'json':
+        return Codec(name, json.dumps, json.loads)
+    if name == 'orjson':
+        import orjson
+        return Codec(name, orjson.dumps, orjson.loads)
+    if name == 'ujson':
+        import ujson
+        return Codec(name, ujson.dumps, ujson.loads)
+    if name == 'simplejson':
+        import simplejson
+        return Codec(name, simplejson.dumps, simplejson.loads)
+    raise ValueError('Unknown json backend %s, expected one of %s' % (name, ', '.join(BACKENDS)))
+
+
+def available_codecs():
+    codecs = []
+    for name in BACKENDS:
+        try:
+            codecs.append(load_codec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+_codec = load_codec('json')
+
+
+def get_codec():
+    return _codec
+
+
+def set_codec(name):
+    """
+    Use the named backend, 'auto' picks the fastest one that is installed
+    """
+    global _codec
+    if name == 'auto':
+        _codec = available_codecs()[0]
+    else:
+        _codec = load_codec(name)
+    return _codec
+
+
+def dumps(data):
+    return _codec.dumps(data)
+
+
+def loads(content):
+    return _codec.loads(content)
+
+
+def decode_response(response):
+    """
+    Decode a response body once, the result is kept on the response so error
+    checking and deserialization share it. Raises ValueError for invalid json.
+    """
+    try:
+        return response._decoded_json
+    except AttributeError:
+        pass
+    response._decoded_json = loads(response.content)
+    return response._decoded_json
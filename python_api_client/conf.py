@@ -0,0 +1,199 @@
+"""
+Settings for the client, resolved the first time one is read.
+
+Values come from configure(), then django settings, then a settings module on
+the path, then the defaults. Nothing is imported or looked up until a setting
+is used, so importing the models stays cheap and settings can be changed
+after import. Settings(parent, **overrides) is a separate set of settings
+for models talking to another api, anything it does not override is read
+from parent.
+"""
+from __future__ import absolute_import
+
+import datetime
+import threading
+
+DEFAULTS = {
+    'BASE_API_URL': 'http://localhost:8001/api/',
+    'TIME_ZONE': 'Europe/London',
+}
+
+_timezones = {}
+
+
+def get_timezone(name):
+    """
+    The pytz timezone called name, pytz is imported the first time one is needed
+    """
+    try:
+        return _timezones[name]
+    except KeyError:
+        import pytz
+        timezone = _timezones[name] = pytz.timezone(name)
+        return timezone
+
+
+def load_settings():
+    """
+    Read the settings from django or a settings module, the defaults if neither exists
+    """
+    try:
+        from django.conf import settings
+        return {'BASE_API_URL': settings.BASE_API_URL, 'TIME_ZONE': settings.TIME_ZONE}
+    except Exception:
+        pass
+    try:
+        import settings
+        return {'BASE_API_URL': settings.BASE_API_URL, 'TIME_ZONE': settings.TIME_ZONE}
+    except AttributeError:
+        raise Exception('You must set BASE_API_URL in in a settings.py file in your path.')
+    except ImportError:
+        # Assume testcase for now
+        return dict(DEFAULTS)
+
+
+class Settings(object):
+    """
+    Settings read as attributes, eg settings.BASE_API_URL. Without a parent
+    they are loaded with load_settings on first use.
+    """
+
+    def __init__(self, parent=None, **overrides):
+        self._parent = parent
+        self._overrides = overrides
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._loaded is None:
+                self._loaded = load_settings()
+        return self._loaded
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._overrides[name]
+        except KeyError:
+            pass
+        if self._parent is not None:
+            return getattr(self._parent, name)
+        try:
+            return (self._loaded or self._load())[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def configure(self, **overrides):
+        self._overrides = dict(self._overrides, **overrides)
+
+    @property
+    def timezone(self):
+        return get_timezone(self.TIME_ZONE)
+
+
+class LazySetting(object):
+    """
+    Stands in for a setting imported as a module constant, the value is read
+    from settings each time it is used
+    """
+
+    def __init__(self, name, settings_=None):
+        self.name = name
+        self._settings = settings_
+
+    @property
+    def value(self):
+        return getattr(self._settings or settings, self.name)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __unicode__(self):
+        return u'%s' % self.value
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __add__(self, other):
+        return self.value + other
+
+    def __radd__(self, other):
+        return other + self.value
+
+    def __mod__(self, other):
+        return self.value % other
+
+    def __eq__(self, other):
+        return self.value == other
+
+    def __ne__(self, other):
+        return self.value != other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+
+class LazyTimezone(datetime.tzinfo):
+    """
+    Stands in for the settings' pytz timezone imported as a module constant,
+    pytz is only imported when it is first used. Works as a tzinfo and has
+    the timezone's localize, normalize and zone.
+    """
+
+    def __init__(self, settings_=None):
+        self._settings = settings_
+
+    @property
+    def value(self):
+        return (self._settings or settings).timezone
+
+    def utcoffset(self, dt):
+        return self.value.utcoffset(dt if dt is None else dt.replace(tzinfo=None))
+
+    def dst(self, dt):
+        return self.value.dst(dt if dt is None else dt.replace(tzinfo=None))
+
+    def tzname(self, dt):
+        return self.value.tzname(dt if dt is None else dt.replace(tzinfo=None))
+
+    def fromutc(self, dt):
+        return self.value.fromutc(dt.replace(tzinfo=self.value))
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __eq__(self, other):
+        return self.value == other
+
+    def __ne__(self, other):
+        return self.value != other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+
+settings = Settings()
+
+
+def configure(**overrides):
+    """
+    Override process wide settings, eg configure(BASE_API_URL='https://api.example.com/v2/')
+    """
+    settings.configure(**overrides)
@@ -0,0 +1,159 @@
+"""
+Date parsing for model fields.
+
+ISO-8601 / RFC 3339 strings, which is what the api sends, are parsed with a
+regex. Anything else falls back to dateutil, which is only imported the first
+time it is needed. Parsed values are cached by their string as list responses
+tend to repeat the same timestamps.
+"""
+import re
+import threading
+from datetime import datetime, timedelta, tzinfo
+
+import six
+
+CACHE_SIZE = 10000
+
+ISO_8601_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d{1,6})\d*)?)?'
+    r'(Z|[+-]\d{2}(?::?\d{2})?)?)?$'
+)
+
+
+
+class FixedOffset(tzinfo):
+    """
+    A fixed utc offset of seconds, for the offsets in iso strings
+    """
+
+    def __init__(self, seconds):
+        self._seconds = seconds
+        self._offset = timedelta(seconds=seconds)
+        hours, minutes = divmod(abs(seconds) // 60, 60)
+        self._name = 'UTC%s%02d:%02d' % ('-' if seconds < 0 else '+', hours, minutes) if seconds else 'UTC'
+
+    def __getinitargs__(self):
+        return (self._seconds,)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+    def __repr__(self):
+        return '<FixedOffset %s>' % self._name
+
+
+UTC = FixedOffset(0)
+
+_offsets = {}
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _tz(value):
+    if value == 'Z':
+        return UTC
+    try:
+        return _offsets[value]
+    except KeyError:
+        sign = -1 if value[0] == '-' else 1
+        digits = value[1:].replace(':', '')
+        seconds = sign * (int(digits[:2]) * 3600 + int(digits[2:4] or 0) * 60)
+        tz = _offsets[value] = UTC if seconds == 0 else FixedOffset(seconds)
+        return tz
+
+
+def parse_iso(value):
+    """
+    Parse an ISO-8601 date or datetime, returns None if it is not in that format
+    """
+    match = ISO_8601_RE.match(value)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, tz = match.groups()
+    microsecond = 0
+    if fraction:
+        microsecond = int(fraction.ljust(6, '0'))
+    return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                    microsecond, tz and _tz(tz))
+
+
+def localize(value, timezone):
+    """
+    Naive datetimes are taken to be in timezone, aware ones are converted to it
+    """
+    if value.tzinfo is None:
+        return timezone.localize(value)
+    return value.astimezone(timezone)
+
+
+def parse_datetime(value, timezone=None):
+    """
+    Parse a date string in to a datetime in timezone (a pytz timezone)
+    """
+    key = (value, timezone)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+
+    parsed = parse_iso(value)
+    if parsed is None:
+        import dateutil.parser
+        parsed = dateutil.parser.parse(value)
+    if timezone is not None:
+        parsed = localize(parsed, timezone)
+
+    with _cache_lock:
+        if len(_cache) >= CACHE_SIZE:
+            _cache.clear()
+        _cache[key] = parsed
+    return parsed
+
+
+class LazyDate(object):
+    """
+    Descriptor for a date field that keeps the api string until the field is
+    first read. slot is the slot holding the value on models with declared
+    fields, other models keep it in the instance __dict__.
+    """
+
+    def __init__(self, name, slot=None, index=None):
+        self.name = name
+        self.slot = slot
+        self.index = index
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            if self.slot is None:
+                value = instance.__dict__[self.name]
+            else:
+                value = self.slot.__get__(instance, owner)
+        except KeyError:
+            raise AttributeError(self.name)
+        if isinstance(value, six.string_types) and value:
+            parsed = instance.deserialize_date(value)
+            self.__set__(instance, parsed)
+            self._update_snapshot(instance, value, parsed)
+            return parsed
+        return value
+
+    def __set__(self, instance, value):
+        if self.slot is None:
+            instance.__dict__[self.name] = value
+        else:
+            self.slot.__set__(instance, value)
+
+    def _update_snapshot(self, instance, value, parsed):
+        # parsing is not a change, so keep the snapshot in step
+        snapshot = getattr(instance, '_snapshot', None)
+        if self.index is not None and snapshot is not None and snapshot[self.index] == value:
+            instance._snapshot = snapshot[:self.index] + (parsed,) + snapshot[self.index + 1:]
@@ -30,13 +30,27 @@ class MethodNotAllowed(ApiException):
     pass
 
 
+class RateLimitedException(ApiException):
+    pass
+
+
+class ServiceUnavailableException(ApiException):
+    pass
+
+
+class CircuitOpenException(ApiException):
+    pass
+
+
 RESPONSE_ERROR_EXCEPTIONS = {
     'Resource not found.': NotFoundException,
     'Authentication failed.': AuthFailureException,
     401: UnauthorizedException,
     403: ForbiddenException,
     404: NotFoundException,
+    429: RateLimitedException,
     501: MethodNotAllowed,
+    503: ServiceUnavailableException,
 }
 
 
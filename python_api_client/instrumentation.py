@@ -0,0 +1,209 @@
+"""
+Hooks and metrics for the requests ResourceSet sends.
+
+Nothing is recorded until a sink, hook or tracer is added, ResourceSet only
+checks Instrumentation.enabled so the cost when it is off is one attribute
+lookup per request.
+
+Metrics recorded, labelled by model and method where it makes sense:
+    api_requests_total, api_request_seconds, api_response_bytes,
+    api_deserialize_seconds, api_cache_hits_total, api_cache_misses_total,
+    api_cache_revalidations_total, api_retries_total
+"""
+import socket
+import threading
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+@contextmanager
+def null_span():
+    yield
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    labels = list(key) + list(extra or ())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in labels)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry(object):
+    """
+    In process counters and histograms that can be exported in the
+    Prometheus text format
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(BYTES_BUCKETS if name.endswith('_bytes') else SECONDS_BUCKETS)
+            self.histograms[key].observe(value)
+
+    def get_counter(self, name, **labels):
+        return self.counters.get((name, _label_key(labels)), 0)
+
+    def get_histogram(self, name, **labels):
+        return self.histograms.get((name, _label_key(labels)))
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        typed = set()
+        for (name, key), value in counters:
+            if name not in typed:
+                lines.append('# TYPE %s counter' % name)
+                typed.add(name)
+            lines.append('%s%s %s' % (name, _format_labels(key), value))
+        for (name, key), histogram in histograms:
+            if name not in typed:
+                lines.append('# TYPE %s histogram' % name)
+                typed.add(name)
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append('%s_bucket%s %s' % (name, _format_labels(key, [('le', bound)]), count))
+            lines.append('%s_bucket%s %s' % (name, _format_labels(key, [('le', '+Inf')]), histogram.count))
+            lines.append('%s_sum%s %s' % (name, _format_labels(key), histogram.sum))
+            lines.append('%s_count%s %s' % (name, _format_labels(key), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdSink(object):
+    """
+    Sends metrics to a StatsD server over udp. Labels are sent as dogstatsd
+    tags if tags is True, otherwise they are appended to the metric name.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='python_api_client', tags=False):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.tags = tags
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, labels):
+        if self.tags or not labels:
+            return '%s.%s' % (self.prefix, name)
+        return '%s.%s.%s' % (self.prefix, name, '.'.join(str(v) for k, v in sorted(labels.items())))
+
+    def _send(self, name, value, kind, labels):
+        line = '%s:%s|%s' % (self._name(name, labels), value, kind)
+        if self.tags and labels:
+            line += '|#%s' % ','.join('%s:%s' % item for item in sorted(labels.items()))
+        try:
+            self._socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def increment(self, name, value=1, **labels):
+        self._send(name, value, 'c', labels)
+
+    def observe(self, name, value, **labels):
+        if name.endswith('_seconds'):
+            self._send(name, int(value * 1000), 'ms', labels)
+        else:
+            self._send(name, value, 'h', labels)
+
+
+class Instrumentation(object):
+    """
+    pre_request hooks are called with (resource_set, method, url, kwargs) and
+    can change kwargs, post_request hooks with (resource_set, method, url,
+    response, elapsed, error). tracer(name, attributes) should return a
+    context manager that wraps each request in a span.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sinks = []
+        self.pre_request_hooks = []
+        self.post_request_hooks = []
+        self.tracer = None
+
+    def _update(self):
+        self.enabled = bool(self.sinks or self.pre_request_hooks or self.post_request_hooks or self.tracer)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self._update()
+        return sink
+
+    def add_pre_request(self, hook):
+        self.pre_request_hooks.append(hook)
+        self._update()
+
+    def add_post_request(self, hook):
+        self.post_request_hooks.append(hook)
+        self._update()
+
+    def set_tracer(self, tracer):
+        self.tracer = tracer
+        self._update()
+
+    def clear(self):
+        self.sinks = []
+        self.pre_request_hooks = []
+        self.post_request_hooks = []
+        self.tracer = None
+        self._update()
+
+    def increment(self, name, value=1, **labels):
+        for sink in self.sinks:
+            sink.increment(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        for sink in self.sinks:
+            sink.observe(name, value, **labels)
+
+    def span(self, name, **attributes):
+        if self.tracer is None:
+            return null_span()
+        return self.tracer(name, attributes)
+
+    def pre_request(self, resource_set, method, url, kwargs):
+        for hook in self.pre_request_hooks:
+            hook(resource_set, method, url, kwargs)
+
+    def post_request(self, resource_set, method, url, response, elapsed, error):
+        for hook in self.post_request_hooks:
+            hook(resource_set, method, url, response, elapsed, error)
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    return _instrumentation
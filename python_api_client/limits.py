@@ -0,0 +1,212 @@
+"""
+Client side rate limiting and concurrency limits for ResourceSet.send.
+
+A Limiter combines a token bucket (requests per second with a burst) and a
+maximum number of requests in flight. Limiters are registered against a url
+prefix or a base url, and every request to a matching url has to get through
+it first, or against a model, whose requests use it instead of a url's. FileTokenBucket keeps the bucket in a local file so
+every process on a host shares one budget.
+
+Limiters record how long requests waited so self imposed throttling can be told
+apart from the api's own rate limiting.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket(object):
+    """
+    rate tokens are added per second up to burst. take() reserves a token and
+    returns the seconds to wait before using it.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens, updated, now):
+        tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+        wait = 0.0
+        if tokens < 0:
+            wait = -tokens / self.rate
+        return tokens, wait
+
+    def take(self):
+        with self._lock:
+            now = time.time()
+            self._tokens, wait = self._reserve(self._tokens, self._updated, now)
+            self._updated = now
+            return wait
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket whose state is kept in a file locked with flock, so every
+    process using the same path shares it
+    """
+
+    def __init__(self, path, rate, burst=None):
+        super(FileTokenBucket, self).__init__(rate, burst)
+        self.path = path
+
+    def take(self):
+        import fcntl
+
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                now = time.time()
+                try:
+                    tokens, updated = [float(v) for v in os.read(fd, 64).decode('ascii').split()]
+                except ValueError:
+                    tokens, updated = self.burst, now
+                tokens, wait = self._reserve(tokens, updated, now)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, ('%r %r' % (tokens, now)).encode('ascii'))
+                return wait
+            finally:
+                os.close(fd)
+
+
+class Limiter(object):
+    """
+    rate / burst - requests per second allowed and the burst above that
+    max_in_flight - requests allowed at the same time
+    path - keep the rate budget in this file to share it between processes
+    """
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None, path=None):
+        self.bucket = None
+        if rate is not None:
+            self.bucket = FileTokenBucket(path, rate, burst) if path else TokenBucket(rate, burst)
+        self.semaphore = None
+        if max_in_flight is not None:
+            self.semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.in_flight = 0
+
+    def _record(self, waited):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            if waited > 0:
+                self.throttled += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    @contextmanager
+    def acquire(self):
+        start = time.time()
+        if self.semaphore is not None:
+            self.semaphore.acquire()
+        try:
+            if self.bucket is not None:
+                wait = self.bucket.take()
+                if wait > 0:
+                    time.sleep(wait)
+            self._record(time.time() - start)
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    def get_stats(self):
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'wait_time': self.wait_time,
+            'max_wait': self.max_wait,
+            'in_flight': self.in_flight,
+        }
+
+
+class Limits(object):
+    """
+    Limiters by model and by url prefix, a request for a model with a limiter
+    uses it, otherwise the longest matching prefix wins
+    """
+
+    def __init__(self):
+        self._limiters = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def limit(self, url, **kwargs):
+        """
+        Limit requests to url and below, takes the same arguments as Limiter
+        """
+        limiter = Limiter(**kwargs)
+        with self._lock:
+            self._limiters[url] = limiter
+        return limiter
+
+    def limit_model(self, model, **kwargs):
+        """
+        Limit the model's requests whatever url they are sent to, takes the
+        same arguments as Limiter
+        """
+        limiter = Limiter(**kwargs)
+        with self._lock:
+            self._models[model] = limiter
+        return limiter
+
+    def model_limiter(self, model):
+        """
+        The model's limiter, the one for its _rate_limit is made the first
+        time it is needed
+        """
+        limiter = self._models.get(model)
+        if limiter is None and getattr(model, '_rate_limit', None):
+            with self._lock:
+                limiter = self._models.get(model)
+                if limiter is None:
+                    limiter = self._models[model] = Limiter(**model._rate_limit)
+        return limiter
+
+    def get(self, url, model=None):
+        if model is not None:
+            limiter = self.model_limiter(model)
+            if limiter is not None:
+                return limiter
+        match = None
+        for prefix in list(self._limiters):
+            if url.startswith(prefix) and (match is None or len(prefix) > len(match)):
+                match = prefix
+        if match is not None:
+            return self._limiters[match]
+        return None
+
+    def get_stats(self):
+        """
+        Stats by url prefix and by model name
+        """
+        stats = dict((url, limiter.get_stats()) for url, limiter in list(self._limiters.items()))
+        stats.update((model.__name__, limiter.get_stats()) for model, limiter in list(self._models.items()))
+        return stats
+
+
+@contextmanager
+def no_limit():
+    yield
+
+
+_default_limits = Limits()
+
+
+def get_default_limits():
+    return _default_limits
@@ -1,28 +1,26 @@
+import types
+
 import six
-import pytz
-import dateutil.parser
 from abc import ABCMeta
 
+from . import conf
+from .aio import AsyncResourceSet
+from .dates import LazyDate, parse_datetime
 from .resource import ResourceSet
+from .tracking import track
 from .exceptions import ApiException, CantSaveException
 
-try:
-    from django.conf import settings
-    BASE_API_URL = settings.BASE_API_URL
-    TIME_ZONE = settings.TIME_ZONE
-except Exception:
-    try:
-        import settings
-        BASE_API_URL = settings.BASE_API_URL
-        TIME_ZONE = settings.TIME_ZONE
-    except AttributeError:
-        raise Exception('You must set BASE_API_URL in in a settings.py file in your path.')
-    except ImportError:
-        # Assume testcase for now
-        BASE_API_URL = 'http://localhost:8001/api/'
-        TIME_ZONE = 'Europe/London'
-
-bst = pytz.timezone(TIME_ZONE)
+# kept for code that imports them, the values are read from conf.settings when used
+BASE_API_URL = conf.LazySetting('BASE_API_URL')
+TIME_ZONE = conf.LazySetting('TIME_ZONE')
+bst = conf.LazyTimezone()
+
+
+# marks a declared field that has no value
+MISSING = object()
+
+# field values whose changes are tracked, see tracking
+NESTED_TYPES = (dict, list)
 
 
 class ValidationError(Exception):
@@ -37,6 +35,9 @@ class Manager(object):
         except AttributeError:
             raise Exception('Manager must have a model to get the resource.')
 
+    def using(self, client):
+        return self.get_resource().using(client)
+
     def get(self, *args, **kwargs):
         return self.get_resource().get(*args, **kwargs)
 
@@ -46,9 +47,114 @@ class Manager(object):
     def all(self, *args, **kwargs):
         return self.get_resource().all(*args, **kwargs)
 
+    def only(self, *args, **kwargs):
+        return self.get_resource().only(*args, **kwargs)
+
+    def defer(self, *args, **kwargs):
+        return self.get_resource().defer(*args, **kwargs)
+
+    def prefetch_related(self, *args, **kwargs):
+        return self.get_resource().prefetch_related(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         return self.get_resource().delete(*args, **kwargs)
 
+    def in_bulk(self, *args, **kwargs):
+        return self.get_resource().in_bulk(*args, **kwargs)
+
+    def bulk_create(self, *args, **kwargs):
+        return self.get_resource().bulk_create(*args, **kwargs)
+
+    def bulk_update(self, *args, **kwargs):
+        return self.get_resource().bulk_update(*args, **kwargs)
+
+    def bulk_delete(self, *args, **kwargs):
+        return self.get_resource().bulk_delete(*args, **kwargs)
+
+    def get_async_resource(self):
+        try:
+            return AsyncResourceSet(self.model)
+        except AttributeError:
+            raise Exception('Manager must have a model to get the resource.')
+
+    def aget(self, *args, **kwargs):
+        return self.get_async_resource().aget(*args, **kwargs)
+
+    def afilter(self, *args, **kwargs):
+        return self.get_async_resource().filter(*args, **kwargs)
+
+    def aall(self, *args, **kwargs):
+        return self.get_async_resource().all(*args, **kwargs)
+
+    def asave(self, *args, **kwargs):
+        return self.get_async_resource().asave(*args, **kwargs)
+
+    def adelete(self, *args, **kwargs):
+        return self.get_async_resource().adelete(*args, **kwargs)
+
+
+DESERIALIZE_PREFIX = '_deserialize_'
+RAW_PREFIX = '_raw_'
+
+
+def _convert_date(instance, value, data_dict):
+    if not value:
+        return value
+    return instance.deserialize_date(value)
+
+
+def _method_converter(model, name):
+    """
+    A converter calling the _deserialize_<key> attribute name, methods are
+    called with the instance and staticmethods, classmethods or other
+    callables with just the value and data
+    """
+    raw = next(klass.__dict__[name] for klass in model.__mro__ if name in klass.__dict__)
+    if isinstance(raw, types.FunctionType):
+        return raw
+    convert = getattr(model, name)
+    return lambda instance, value, data_dict: convert(value, data_dict)
+
+
+def build_deserializers(model):
+    """
+    Work out once per class how each api key is deserialized.
+
+    Returns a tuple of (key, attribute name, converter) where converter is a
+    _deserialize_<key> method, date parsing for _date_fields or None.
+    Models with declared fields get a step for every field, other models only
+    for the keys that need converting or renaming.
+    """
+    renamed = model._renamed_fields or {}
+    converters = {}
+    if not model._lazy_dates:
+        for key in model._date_fields or ():
+            converters[key] = _convert_date
+    for name in dir(model):
+        if name.startswith(DESERIALIZE_PREFIX) and callable(getattr(model, name)):
+            converters[name[len(DESERIALIZE_PREFIX):]] = _method_converter(model, name)
+
+    if model._fields is not None:
+        keys = dict((attr, key) for key, attr in renamed.items())
+        # relations the api embeds are kept as they are until prefetch_related converts them
+        relations = tuple((name, name, None) for name in model._relations or () if name not in model._fields)
+        return tuple((keys.get(attr, attr), attr, converters.get(keys.get(attr, attr)))
+                     for attr in model._fields) + relations
+    return tuple((key, renamed.get(key, key), converters.get(key))
+                 for key in sorted(set(converters) | set(renamed)))
+
+
+def data_descriptors(model):
+    """
+    Names that must be set with setattr rather than straight in to __dict__
+    """
+    names = set()
+    for klass in model.__mro__:
+        for name, attr in klass.__dict__.items():
+            if hasattr(type(attr), '__set__') and not isinstance(attr, LazyDate):
+                names.add(name)
+    return frozenset(names)
+
 
 class ModelBase(ABCMeta):
     """
@@ -57,8 +163,40 @@ class ModelBase(ABCMeta):
     Adds Manager to access the resource
     """
     def __new__(mcs, name, bases, attrs):
+        def class_attr(attr):
+            if attr in attrs:
+                return attrs[attr]
+            return getattr(bases[0], attr, None)
+
+        fields = attrs.get('_fields')
+        lazy_dates = ()
+        if class_attr('_lazy_dates'):
+            lazy_dates = tuple(class_attr('_date_fields') or ())
+        if fields is not None and '__slots__' not in attrs:
+            # declared fields are stored in slots so instances have no __dict__,
+            # lazy dates are kept in a _raw_ slot behind a LazyDate descriptor
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(klass.__dict__.get('__slots__', ()))
+            slots = tuple(RAW_PREFIX + f if f in lazy_dates else f for f in fields)
+            slots += ('_snapshot', '_deferred', '_source', '_dirty')
+            slots += tuple(name for name in class_attr('_relations') or () if name not in fields)
+            attrs['__slots__'] = tuple(f for f in slots if f not in inherited)
+            attrs['_field_index'] = dict((f, i) for i, f in enumerate(fields))
+
         new_class = super(ModelBase, mcs).__new__(mcs, name, bases, attrs)
 
+        field_index = new_class._field_index or {}
+        for field in lazy_dates:
+            slot = getattr(new_class, RAW_PREFIX + field, None) if field in field_index else None
+            setattr(new_class, field, LazyDate(field, slot, field_index.get(field)))
+        new_class._deserializers = build_deserializers(new_class)
+        if new_class._fields is not None:
+            # slot and LazyDate setters, so loading skips __setattr__ and its dirty tracking
+            new_class._setters = tuple(getattr(new_class, attr).__set__ for key, attr, c in new_class._deserializers)
+        new_class._data_descriptors = data_descriptors(new_class)
+
         manager = Manager()
         setattr(manager, 'model', new_class)
         setattr(new_class, 'objects', manager)
@@ -71,10 +209,108 @@ class Model(six.with_metaclass(ModelBase)):
     Abstract model
     To be extended.
     By default the resource url is constructed from the classname but this can be overridden
+
+    Set _fields to a tuple of field names to store instances in __slots__ instead
+    of a __dict__, keys in the api data that are not declared are ignored.
     """
+    __slots__ = ()
 
+    _fields = None
+    _field_index = None
+    # {api key: attribute name} for keys stored under a different name
+    _renamed_fields = None
+    # keys parsed with deserialize_date, when first read if _lazy_dates is set
+    _date_fields = None
+    _lazy_dates = False
     _can_save = False
     _initial_data = None
+    # filter used by in_bulk to fetch many pks in one request, eg 'id__in'
+    _bulk_lookup = None
+    # bulk writes PATCH the list endpoint with {'objects': [...], 'deleted_objects': [...]}
+    _batch_writes = False
+    # Limiter arguments for requests to this model's url, eg {'rate': 10, 'max_in_flight': 4}
+    _rate_limit = None
+    # seconds GET responses are cached for, None disables the response cache
+    _cache_ttl = None
+    # {name: ForeignKey or Nested} loaded with prefetch_related
+    _relations = None
+    # query param asking the api to embed relations, eg 'expand' or 'include'
+    _expand_param = None
+    # query param listing the keys to return for only() and defer(), None to not send one
+    _fields_param = 'fields'
+    # wrap dict and list values so changing them in place marks the field dirty,
+    # without it call mark_dirty(name) after changing one
+    _track_nested = True
+    # filter for results changed since a time, eg 'modified__gte', used by ResourceSet.refresh
+    _modified_since = None
+    # conf.Settings for this model, eg conf.Settings(conf.settings, BASE_API_URL='https://other/api/'),
+    # None uses conf.settings
+    _settings = None
+    # client.Client the model's requests are sent with, None uses the process default
+    _client = None
+
+    def __setattr__(self, name, value):
+        if name[0] == '_':
+            object.__setattr__(self, name, value)
+            return
+        if self._track_nested and isinstance(value, NESTED_TYPES) and name not in (self._relations or ()):
+            value = track(value, self, name)
+        object.__setattr__(self, name, value)
+        self.mark_dirty(name)
+
+    def mark_dirty(self, name):
+        """
+        Record that a field was changed so serialize_changed sends it
+        """
+        try:
+            dirty = self._dirty
+        except AttributeError:
+            dirty = None
+        if dirty is None:
+            dirty = set()
+            object.__setattr__(self, '_dirty', dirty)
+        dirty.add(name)
+
+    def __getattr__(self, name):
+        # only called for missing attributes, deferred fields are loaded on first read
+        if name.startswith('_'):
+            raise AttributeError(name)
+        deferred = getattr(self, '_deferred', None)
+        if deferred and name in deferred:
+            self.load_deferred()
+            return getattr(self, name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
+
+    def load_deferred(self, **kwargs):
+        """
+        Fetch the fields left out by only() or defer() with one GET through
+        the set the instance came from, values changed since the instance was
+        loaded are kept
+        """
+        deferred = getattr(self, '_deferred', None)
+        if not deferred:
+            return self
+        self._deferred = None
+        resource = getattr(self, '_source', None)
+        if resource is None:
+            resource = self.get_resource()
+        loaded = resource.only(*deferred).get(pk=self.pk, **kwargs)
+        if self._fields is not None:
+            snapshot = list(self._snapshot)
+            for attr in deferred:
+                value = getattr(loaded, attr, MISSING)
+                if value is not MISSING:
+                    object.__setattr__(self, attr, track(value, self, attr))
+                    snapshot[self._field_index[attr]] = loaded._snapshot[self._field_index[attr]]
+            self._snapshot = tuple(snapshot)
+            return self
+        for attr, value in loaded.__dict__.items():
+            if attr not in self.__dict__:
+                self.__dict__[attr] = track(value, self, attr)
+        initial_data = dict(loaded._initial_data)
+        initial_data.update(self._initial_data)
+        self._initial_data = initial_data
+        return self
 
     @property
     def pk(self):
@@ -95,43 +331,184 @@ class Model(six.with_metaclass(ModelBase)):
     def url(cls):
         """
         Can be overriden to insert filter kwargs in to the url
-        return '%s%ss/{item_pk}/relateditems/' % (BASE_API_URL, cls.verbose_name())
+        return '%s%ss/{item_pk}/relateditems/' % (cls.get_settings().BASE_API_URL, cls.verbose_name())
         item_pk filter kwarg will be inserted in to the url
         """
-        return '%s%ss/' % (BASE_API_URL, cls.verbose_name())
+        return '%s%ss/' % (cls.get_settings().BASE_API_URL, cls.verbose_name())
+
+    @classmethod
+    def get_settings(cls):
+        return cls._settings or conf.settings
 
     @classmethod
     def get_resource(cls):
         return cls.objects.get_resource()
 
     def serialize(self):
-        return self.__dict__
+        data = self._serialize_attrs()
+        if self._renamed_fields:
+            data = self._rename_to_keys(data)
+        return data
+
+    def _serialize_attrs(self):
+        if self._fields is None:
+            relations = self._relations or ()
+            return dict((k, v) for k, v in self.__dict__.items() if k[0] != '_' and k not in relations)
+        deferred = getattr(self, '_deferred', None) or ()
+        data = {}
+        for field in self._fields:
+            if field in deferred:
+                continue
+            value = getattr(self, field, MISSING)
+            if value is not MISSING:
+                data[field] = value
+        return data
+
+    def _rename_to_keys(self, data):
+        data = dict(data)
+        for key, attr in self._renamed_fields.items():
+            if attr in data:
+                data[key] = data.pop(attr)
+        return data
 
     def serialize_changed(self):
         """
         returns changed data so we can do a patch request
+
+        Only the fields written since the instance was deserialized are
+        checked, those set back to their loaded value are left out.
         """
-        if self._initial_data is None:
+        if self._fields is not None:
+            snapshot = getattr(self, '_snapshot', None)
+            if snapshot is None:
+                return self.serialize()
+        elif self._initial_data is None:
             return self.serialize()
         else:
-            changed = {}
-            for key, val in self.serialize().iteritems():
-                initial_val = self._initial_data.get(key, None)
-                if not initial_val or val != initial_val:
-                    changed[key] = val
-            return changed
+            keys = dict((attr, key) for key, attr in (self._renamed_fields or {}).items())
+        relations = self._relations or ()
+        changed = {}
+        for attr in getattr(self, '_dirty', None) or ():
+            value = getattr(self, attr, MISSING)
+            if value is MISSING or attr in relations:
+                continue
+            if self._fields is not None:
+                index = self._field_index.get(attr)
+                if index is None:
+                    continue
+                loaded = snapshot[index]
+            else:
+                loaded = self._initial_data.get(keys.get(attr, attr), MISSING)
+            # the loaded dict or list itself was changed in place and marked dirty, see _track_nested
+            if value == loaded and (value is not loaded or not isinstance(value, NESTED_TYPES)):
+                continue
+            changed[attr] = value
+        if self._renamed_fields:
+            changed = self._rename_to_keys(changed)
+        return changed
+
+    def mark_saved(self, attrs=None):
+        """
+        Take the current values as the loaded ones after a successful write,
+        so the next patch only sends what changed since. attrs limits it to
+        the fields that were sent, by default every dirty field.
+
+        The values sent are kept as the loaded ones and tracked dicts and
+        lists are given a new tracked copy, so nothing is deep copied.
+        """
+        dirty = getattr(self, '_dirty', None) or set()
+        loaded = self._snapshot if self._fields is not None else self._initial_data
+        if loaded is None:
+            # nothing was loaded, everything was sent
+            values = self._serialize_attrs()
+        else:
+            values = {}
+            for attr in dirty if attrs is None else dirty & set(attrs):
+                value = getattr(self, attr, MISSING)
+                if value is not MISSING:
+                    values[attr] = value
+        if self._track_nested:
+            for attr, value in values.items():
+                if isinstance(value, NESTED_TYPES):
+                    object.__setattr__(self, attr, track(value, self, attr))
+        if self._fields is not None:
+            snapshot = list(loaded) if loaded is not None else [MISSING] * len(self._fields)
+            for attr, value in values.items():
+                if attr in self._field_index:
+                    snapshot[self._field_index[attr]] = value
+            object.__setattr__(self, '_snapshot', tuple(snapshot))
+        else:
+            keys = dict((attr, key) for key, attr in (self._renamed_fields or {}).items())
+            initial_data = dict(loaded or {})
+            for attr, value in values.items():
+                initial_data[keys.get(attr, attr)] = value
+            object.__setattr__(self, '_initial_data', initial_data)
+        object.__setattr__(self, '_dirty', None if attrs is None else (dirty - set(attrs)) or None)
+        return self
 
     def deserialize(self, data_dict):
         """
         Store the values so we can check for updated fields
         """
-        self._initial_data = data_dict
-        for key, value in data_dict.iteritems():
-            if hasattr(self, '_deserialize_%s' % key):
-                value = getattr(self, '_deserialize_%s' % key)(value, data_dict)
-            setattr(self, key, value)
+        # loading is not a change, so values are set without marking them dirty
+        set_attr = object.__setattr__
+        if self._fields is not None:
+            snapshot = []
+            track_nested = self._track_nested
+            for (key, attr, converter), setter in zip(self._deserializers, self._setters):
+                if key in data_dict:
+                    value = data_dict[key]
+                    if converter is not None:
+                        value = converter(self, value, data_dict)
+                    if track_nested and type(value) in NESTED_TYPES:
+                        # the snapshot keeps the original, see tracking
+                        setter(self, track(value, self, attr))
+                    else:
+                        setter(self, value)
+                else:
+                    value = getattr(self, attr, MISSING)
+                snapshot.append(value)
+            set_attr(self, '_snapshot', tuple(snapshot))
+            set_attr(self, '_dirty', None)
+            return self
+
+        if self._data_descriptors.isdisjoint(data_dict):
+            attrs = self.__dict__
+            attrs.update(data_dict)
+        else:
+            for key, value in data_dict.iteritems():
+                set_attr(self, key, value)
+            attrs = self.__dict__
+        for key, attr, converter in self._deserializers:
+            if key in data_dict:
+                value = data_dict[key]
+                if converter is not None:
+                    value = converter(self, value, data_dict)
+                if attr != key:
+                    del attrs[key]
+                set_attr(self, attr, value)
+        attrs['_initial_data'] = data_dict
+        attrs['_dirty'] = None
+        if not self._track_nested:
+            return self
+        nested = [key for key, value in data_dict.iteritems() if type(value) in NESTED_TYPES]
+        for key in nested:
+            attr = self._renamed_fields.get(key, key) if self._renamed_fields else key
+            if attrs.get(attr) is data_dict[key]:
+                attrs[attr] = track(data_dict[key], self, attr)
         return self
 
+    @classmethod
+    def deserialize_many(cls, data_list):
+        """
+        Deserialize a list of api dicts in to a list of instances
+        """
+        if cls.__init__ is not object.__init__:
+            # models can set defaults in __init__
+            return [cls().deserialize(data_dict) for data_dict in data_list]
+        new = cls.__new__
+        return [new(cls).deserialize(data_dict) for data_dict in data_list]
+
     def save(self, **kwargs):
         if not self._can_save:
             raise CantSaveException('You cant save a %s.' % self.__class__.__name__)
@@ -141,4 +518,4 @@ class Model(six.with_metaclass(ModelBase)):
         return self.get_resource().delete(self, **kwargs)
 
     def deserialize_date(self, date_string):
-        return dateutil.parser.parse(date_string)
+        return parse_datetime(date_string, self.get_settings().timezone)
@@ -0,0 +1,111 @@
+"""
+Relations between models, declared in Model._relations and loaded for a list
+of instances at a time by ResourceSet.prefetch_related.
+
+    class Child(Model):
+        _relations = {'parent': ForeignKey(lambda: Parent, 'parent_id')}
+
+    class Parent(Model):
+        _relations = {'children': Nested(Child, 'parent_pk')}
+
+The related model can be given as a function returning it so relations can
+refer to models declared further down.
+"""
+from collections import OrderedDict
+
+import six
+
+from .resource import BULK_NONE, BULK_WORKERS, CHUNK_SIZE
+
+
+class Relation(object):
+
+    def __init__(self, model):
+        self._model = model
+
+    @property
+    def model(self):
+        if not isinstance(self._model, type):
+            self._model = self._model()
+        return self._model
+
+    def from_data(self, value):
+        """
+        Instances for data the api embedded in the parent, or None if it was not embedded
+        """
+        raise NotImplementedError
+
+    def prefetch(self, resource_set, name, instances, max_workers=BULK_WORKERS):
+        """
+        Fetch the related objects of instances and set them as name on each one
+        """
+        raise NotImplementedError
+
+
+class ForeignKey(Relation):
+    """
+    key - attribute holding the pk of the related object, eg 'parent_id'
+
+    Related objects are fetched with in_bulk, so in batches if the related
+    model has a _bulk_lookup, and set to None if they are missing.
+    """
+
+    def __init__(self, model, key):
+        super(ForeignKey, self).__init__(model)
+        self.key = key
+
+    def from_data(self, value):
+        if isinstance(value, dict):
+            return self.model.deserialize_many([value])[0]
+        return None
+
+    def prefetch(self, resource_set, name, instances, max_workers=BULK_WORKERS):
+        pks = [getattr(instance, self.key, None) for instance in instances]
+        related = resource_set._related_resource(self.model).in_bulk(
+            [pk for pk in pks if pk is not None], max_workers=max_workers, on_error=BULK_NONE)
+        for instance, pk in zip(instances, pks):
+            setattr(instance, name, related.get(pk))
+
+
+class Nested(Relation):
+    """
+    filter - filter kwarg the parent pk is passed as, usually one embedded in
+    the related model's url, eg 'parent_pk' for /parents/{parent_pk}/children/
+
+    Each parent's list is fetched on its own, at most max_workers at a time.
+    If the api can filter on many parents at once give lookup, eg 'parent__in',
+    and key, the attribute of a related object holding its parent's pk, to
+    fetch CHUNK_SIZE parents per request instead.
+    """
+
+    def __init__(self, model, filter=None, lookup=None, key=None):
+        super(Nested, self).__init__(model)
+        self.filter = filter
+        self.lookup = lookup
+        self.key = key
+
+    def from_data(self, value):
+        if isinstance(value, list):
+            return self.model.deserialize_many(value)
+        return None
+
+    def prefetch(self, resource_set, name, instances, max_workers=BULK_WORKERS):
+        pks = list(OrderedDict.fromkeys(instance.pk for instance in instances))
+        if self.lookup:
+            chunks = [pks[i:i + CHUNK_SIZE] for i in range(0, len(pks), CHUNK_SIZE)]
+            results = resource_set._run_bulk(lambda chunk: self._fetch_chunk(resource_set, chunk), chunks, max_workers)
+            by_pk = dict((pk, []) for pk in pks)
+            for related in results:
+                for obj in related:
+                    by_pk.setdefault(getattr(obj, self.key, None), []).append(obj)
+        else:
+            by_pk = dict(resource_set._run_bulk(lambda pk: (pk, self._fetch_one(resource_set, pk)), pks, max_workers))
+        for instance in instances:
+            setattr(instance, name, by_pk.get(instance.pk, []))
+
+    def _fetch_chunk(self, resource_set, pks):
+        lookup = {self.lookup: ','.join(six.text_type(pk) for pk in pks)}
+        return list(resource_set._related_resource(self.model).filter(**lookup).iterator())
+
+    def _fetch_one(self, resource_set, pk):
+        return list(resource_set._related_resource(self.model).filter(**{self.filter: pk}).iterator())
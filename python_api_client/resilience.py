@@ -0,0 +1,184 @@
+"""
+Retries with backoff and per host circuit breakers for ResourceSet.send.
+
+Idempotent requests that fail with a connection error or a retryable status
+are retried with exponential backoff and full jitter, honouring Retry-After.
+A circuit breaker per host fails fast with CircuitOpenException once the api
+has failed failure_threshold times in a row, and lets a trial request through
+after reset_timeout.
+"""
+import random
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+from .exceptions import CircuitOpenException
+
+IDEMPOTENT_METHODS = ('get', 'head', 'options', 'put', 'delete')
+RETRY_STATUSES = (429, 502, 503, 504)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def retry_after(response):
+    """
+    Seconds the server asked us to wait in a Retry-After header, or None
+    """
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        # http dates are rare, email is only imported for them
+        from email.utils import mktime_tz, parsedate_tz
+
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(mktime_tz(parsed) - time.time(), 0)
+
+
+class RetryPolicy(object):
+    """
+    max_retries - retries after the first attempt
+    backoff / max_backoff - the nth retry waits up to backoff * 2 ** n seconds, capped at max_backoff
+    timeout - seconds allowed for each attempt
+    deadline - seconds allowed for all attempts and waits together
+    """
+
+    def __init__(self, max_retries=2, backoff=0.1, max_backoff=10.0, timeout=None, deadline=None,
+                 methods=IDEMPOTENT_METHODS, statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.deadline = deadline
+        self.methods = methods
+        self.statuses = statuses
+
+    def attempt_timeout(self, start):
+        """
+        Timeout for the next attempt, cut short by the deadline
+        """
+        if self.deadline is None:
+            return self.timeout
+        remaining = max(self.deadline - (time.time() - start), 0.001)
+        if self.timeout is None:
+            return remaining
+        return min(self.timeout, remaining)
+
+    def delay(self, method, attempt, start, response=None):
+        """
+        Seconds to wait before retrying, or None if the request should not be retried.
+        response is None when the attempt failed to connect or timed out.
+        """
+        if method.lower() not in self.methods or attempt >= self.max_retries:
+            return None
+        if response is not None and response.status_code not in self.statuses:
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if response is not None and response.status_code in (429, 503):
+            wait = retry_after(response)
+            if wait is not None:
+                if wait > self.max_backoff:
+                    return None
+                delay = wait
+        if self.deadline is not None and time.time() - start + delay >= self.deadline:
+            return None
+        return delay
+
+
+NO_RETRIES = RetryPolicy(max_retries=0)
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self, url):
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenException('Circuit open for %s after %s failures' % (url, self.failures))
+                # let one trial request through
+                self.state = HALF_OPEN
+                self.opened_at = time.time()
+            elif self.state == HALF_OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenException('Circuit half open for %s, waiting on a trial request' % url)
+                # the trial request never reported back, let another one through
+                self.opened_at = time.time()
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+
+    def release_trial(self):
+        """
+        The trial request failed before it reached the host, it says nothing
+        about the host so the next request is let through as the trial
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+                self.opened_at = time.time() - self.reset_timeout
+
+
+class CircuitBreakers(object):
+    """
+    One CircuitBreaker per host
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+
+_default_policy = RetryPolicy()
+_default_breakers = CircuitBreakers()
+
+
+def get_default_policy():
+    return _default_policy
+
+
+def get_default_breakers():
+    return _default_breakers
+
+
+def configure(retry_policy=None, breakers=None):
+    """
+    Replace the retry policy and/or circuit breakers used by ResourceSets that are not given one
+    """
+    global _default_policy, _default_breakers
+    if retry_policy is not None:
+        _default_policy = retry_policy
+    if breakers is not None:
+        _default_breakers = breakers
@@ -1,8 +1,18 @@
-import requests
+import itertools
 import six
-import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from six.moves.queue import Queue
 from urllib import urlencode
+from urlparse import urljoin
 
+from . import cache, client, codec, coalesce, instrumentation, limits, resilience, session, snapshot
+from .stream import JSONListStream
 from .exceptions import ResourceSetException, AuthFailureException, NotFoundException, ApiException, get_exception_class
 
 CHUNK_SIZE = 100
@@ -10,12 +20,204 @@ ITER_CHUNK_SIZE = CHUNK_SIZE
 
 DELETE_STATUS = [200, 202, 204]
 
+# in_bulk workers and what to do with a pk whose request failed
+BULK_WORKERS = 10
+BULK_RAISE = 'raise'
+BULK_SKIP = 'skip'
+BULK_NONE = 'none'
+
+# identical GETs in flight at the same time share one request
+COALESCE_GETS = True
+
+# bytes read at a time from streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# fetch the next page of a list in the background while the current one is used
+PREFETCH_PAGES = True
+
+
+_scope = threading.local()
+
+
+def per_call_client(method):
+    """
+    Lets a method take a client or token kwarg for one call, the call runs on
+    a clone using them so a shared set is never changed
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        call_client = kwargs.pop('client', None)
+        token = kwargs.pop('token', None)
+        if call_client is not None or token is not None:
+            self = self._clone(token, call_client)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def request_scope():
+    """
+    Inside the block ResourceSets with the same request_key() share one
+    evaluation, eg for the lifetime of a web request. Sets are evaluated in
+    full the first time they are used in a scope.
+    """
+    outer = getattr(_scope, 'results', None)
+    if outer is None:
+        _scope.results = {}
+    try:
+        yield _scope.results
+    finally:
+        _scope.results = outer
+
 
 class Meta(object):
     def __init__(self, **vars):
         self.__dict__.update(vars)
 
 
+class PageFetch(object):
+    """
+    Fetches the pages of one iteration. With background=True the next page is
+    fetched on a worker thread while the current one is used, one worker
+    serves every page so a thread scoped session pool keeps using the same
+    connection. close() stops the worker.
+    """
+
+    def __init__(self, fetch, kwargs, background=False):
+        self._fetch = fetch
+        self._kwargs = kwargs
+        self._background = background
+        self._jobs = None
+        self._results = None
+        self._waiting = None
+
+    def start(self, url, params, background=True):
+        """
+        Start fetching a page, result() returns it
+        """
+        if not (self._background and background):
+            self._waiting = (url, params)
+            return
+        if self._jobs is None:
+            self._jobs, self._results = Queue(), Queue()
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+        self._jobs.put((url, params))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                self._results.put((self._fetch(*job, **self._kwargs), None))
+            except Exception:
+                self._results.put((None, sys.exc_info()))
+
+    def result(self):
+        if self._waiting is not None:
+            url, params = self._waiting
+            self._waiting = None
+            return self._fetch(url, params, **self._kwargs)
+        result, error = self._results.get()
+        if error is not None:
+            six.reraise(*error)
+        return result
+
+    def close(self):
+        if self._jobs is not None:
+            self._jobs.put(None)
+            self._jobs = None
+
+
+def request_errors():
+    """
+    The exceptions one request of a bulk operation can fail with, they are
+    recorded for that item instead of stopping the rest. Only evaluated once
+    a request has failed, so requests is not imported before it is used.
+    """
+    import requests
+    return ApiException, ResourceSetException, requests.RequestException
+
+
+class BulkReport(object):
+    """
+    Outcome of a bulk write for each item, in the order they were given.
+    results is a list of (item, exception or None), skipped items had nothing to send.
+    """
+
+    def __init__(self):
+        self.results = []
+        self.skipped = []
+
+    def add(self, item, error=None, skipped=False):
+        if skipped:
+            self.skipped.append(item)
+        else:
+            self.results.append((item, error))
+
+    @property
+    def succeeded(self):
+        return [item for item, error in self.results if error is None]
+
+    @property
+    def failed(self):
+        return [(item, error) for item, error in self.results if error is not None]
+
+    def __repr__(self):
+        return '<BulkReport succeeded=%s failed=%s skipped=%s>' % (
+            len(self.succeeded), len(self.failed), len(self.skipped))
+
+
+class Projection(object):
+    """
+    The fields a ResourceSet with only() or defer() asks for and keeps.
+    Attribute names are mapped back to api keys through _renamed_fields.
+    """
+
+    def __init__(self, model, only=None, defer=()):
+        keys = dict((attr, key) for key, attr in (model._renamed_fields or {}).items())
+        defer = set(defer)
+        self.keys = None
+        if only is not None:
+            loaded = (set(only) | set(['id'])) - defer
+            self.keys = frozenset(keys.get(attr, attr) for attr in loaded)
+            self.deferred = frozenset(self.known_fields(model)) - loaded
+        elif model._fields is not None:
+            self.keys = frozenset(keys.get(attr, attr) for attr in model._fields if attr not in defer)
+            self.deferred = frozenset(defer)
+        else:
+            self.deferred = frozenset(defer)
+        self.dropped = frozenset(keys.get(attr, attr) for attr in defer)
+
+    @staticmethod
+    def known_fields(model):
+        """
+        The declared fields, models without _fields only name their date,
+        renamed and converted fields
+        """
+        if model._fields is not None:
+            return model._fields
+        renamed = model._renamed_fields or {}
+        keys = set(model._date_fields or ()) | set(renamed)
+        keys.update(name[len('_deserialize_'):] for name in dir(model) if name.startswith('_deserialize_'))
+        return set(renamed.get(key, key) for key in keys)
+
+    def param(self):
+        if self.keys is None:
+            return None
+        return ','.join(sorted(self.keys))
+
+    def apply(self, data):
+        """
+        Leave out the keys that were not asked for, in case the api ignored the projection
+        """
+        if self.keys is not None:
+            return dict((k, v) for k, v in data.items() if k in self.keys)
+        return dict((k, v) for k, v in data.items() if k not in self.dropped)
+
+
 class ResourceSet(object):
     """
     ResourceSet uses python requests to send requests to an api endpoint.
@@ -32,25 +234,36 @@ class ResourceSet(object):
         self._meta = None
         self._result_cache = None
         self._iter = None
+        self._count = None
+        self._probed = False
+        self._fetched_at = None
         self._limit_start = None
         self._limit_stop = None
         self._filters = {}
-        self._token = None
+        self._prefetch = ()
+        self._only = None
+        self._defer = ()
+        self._client = kwargs.get('client')
+        self._pool = kwargs.get('pool')
+        self._cache = kwargs.get('cache')
+        self._retry_policy = kwargs.get('retry_policy')
+        self._circuit_breakers = kwargs.get('circuit_breakers')
+        self._limits = kwargs.get('limits')
 
     def __len__(self):
         if self._result_cache is None:
-            if self._iter:
-                self._result_cache = list(self._iter)
-            else:
-                self._result_cache = list(self.iterator())
-        elif self._iter:
+            # count without fetching every result
+            return self.count()
+        if self._iter:
             self._result_cache.extend(self._iter)
         return len(self._result_cache)
 
     def __iter__(self):
         if self._result_cache is None:
-            self._iter = self.iterator()
-            self._result_cache = []
+            self._result_cache = self._memoized()
+            if self._result_cache is None:
+                self._iter = self.iterator()
+                self._result_cache = []
         if self._iter:
             return self._result_iter()
         return iter(self._result_cache)
@@ -100,6 +313,136 @@ class ResourceSet(object):
         except self.model.DoesNotExist as e:
             raise IndexError(e.args)
 
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self._memoized()
+            if self._result_cache is None:
+                self._result_cache = list(self.iterator())
+        elif self._iter:
+            self._result_cache.extend(self._iter)
+        self._iter = None
+
+    def count(self):
+        """
+        Number of results, read from meta.total_count of a one result request
+        when the api sends it, otherwise the results are fetched
+        """
+        if self._result_cache is not None and not self._iter:
+            return len(self._result_cache)
+        if self._count is None:
+            self._probe()
+        if self._count is None:
+            self._fetch_all()
+            self._count = len(self._result_cache)
+        return self._count
+
+    def exists(self):
+        """
+        True if there are any results, fetches at most one
+        """
+        if self._result_cache is not None and (self._result_cache or not self._iter):
+            return bool(self._result_cache)
+        if self._count is not None:
+            return self._count > 0
+        return bool(self._probe())
+
+    def _probe(self):
+        """
+        Fetch the first result only, sets the count if the api sends meta.total_count
+        """
+        self._probed = True
+        offset = self._limit_start or 0
+        if self._limit_stop is not None and self._limit_stop <= offset:
+            # an empty slice
+            self._count = 0
+            return []
+        params = self.params
+        params['limit_start'] = offset
+        params['limit_stop'] = offset + 1
+        data_list, meta = self._fetch_page(self.build_url(), params)
+        if meta is not None:
+            self._meta = Meta(**meta)
+        if meta and meta.get('total_count') is not None:
+            total = meta['total_count']
+            if self._limit_stop is not None:
+                total = min(total, self._limit_stop)
+            self._count = max(total - offset, 0)
+        elif not data_list:
+            self._count = 0
+        elif (len(data_list) > 1 and not (meta and meta.get('next')) and self._result_cache is None
+              and not offset and self._limit_stop is None):
+            # the api ignored the window and sent every result
+            self._result_cache = list(self._with_related(self._deserialize_many(data_list)))
+            self._count = len(self._result_cache)
+        return data_list
+
+    def dump(self, path):
+        """
+        Evaluate the set and write its results and meta to a snapshot file
+        """
+        self._fetch_all()
+        snapshot.dump(path, self, self._fetched_at or time.time())
+        return path
+
+    def load(self, path):
+        """
+        A copy of this set with the results from a snapshot file, rows are
+        deserialized as they are used
+        """
+        rows = snapshot.SnapshotRows(path, self.model)
+        if rows.header['key'] != self.request_key():
+            rows.close()
+            raise ResourceSetException('%s is a snapshot of a different request' % path)
+        clone = self._clone()
+        clone._result_cache = rows
+        clone._count = len(rows)
+        clone._fetched_at = rows.header['created']
+        if rows.header['meta'] is not None:
+            clone._meta = Meta(**rows.header['meta'])
+        return clone
+
+    def refresh(self, path):
+        """
+        Fetch the results changed since the snapshot in path was made, using
+        the model's _modified_since filter, write them to the snapshot and
+        return the set loaded from it. Deleted results are not removed.
+        """
+        lookup = getattr(self.model, '_modified_since', None)
+        if not lookup:
+            raise ResourceSetException('%s has no _modified_since filter to refresh with' % self.model.__name__)
+        rows = self.load(path)._result_cache
+        since = datetime.utcfromtimestamp(rows.header['created']).isoformat() + 'Z'
+        changed = self.filter(**{lookup: since})
+        created = time.time()
+        try:
+            snapshot.merge(path, rows, list(changed.iterator()), created)
+        finally:
+            rows.close()
+        return self.load(path)
+
+    def request_key(self):
+        """
+        Stable key for the request this set makes, the url and sorted params
+        plus the options that change the instances built from the response
+        """
+        key = cache.make_key('get', self.build_url(), self.params, self.client.auth_key)
+        options = (self._limit_start, self._limit_stop, self._only, tuple(sorted(self._defer)), self._prefetch)
+        return '%s %r' % (key, options)
+
+    def _memoized(self):
+        """
+        The results of an equivalent set evaluated in the current request_scope
+        """
+        results = getattr(_scope, 'results', None)
+        if results is None:
+            return None
+        key = self.request_key()
+        if key not in results:
+            results[key] = list(self.iterator())
+        self._meta = self._meta or results.get((key, 'meta'))
+        results[(key, 'meta')] = self._meta
+        return list(results[key])
+
     def _result_iter(self):
         pos = 0
         while 1:
@@ -122,98 +465,589 @@ class ResourceSet(object):
 
     def iterator(self, *args, **kwargs):
         """
-        Make the request and yield the results
+        Make the requests and yield the results
+
+        Results are fetched one page of page_size at a time, while a page is
+        being consumed the next one is fetched in the background.
+
+        With stream=True (or _stream = True on the model) each page is parsed
+        as it is downloaded and instances are yielded as soon as they arrive.
+        """
+        kwargs.setdefault('stream', getattr(self.model, '_stream', False))
+        self._fetched_at = time.time()
+        for data_list in self._pages(**kwargs):
+            if kwargs['stream']:
+                instances = (self._deserialize_many([data])[0] for data in data_list)
+            else:
+                instances = self._deserialize_many(data_list)
+            for instance in self._with_related(instances):
+                yield instance
+
+    def _with_related(self, instances):
+        if self._prefetch:
+            # related objects are fetched a page of parents at a time
+            return self._prefetch_related(list(instances))
+        return instances
+
+    def _deserialize_many(self, data_list):
+        projection = self.projection
+        if projection is not None:
+            data_list = [projection.apply(data) for data in data_list]
+        inst = instrumentation.get_instrumentation()
+        if not inst.enabled:
+            instances = self.model.deserialize_many(data_list)
+        else:
+            start = time.time()
+            instances = self.model.deserialize_many(data_list)
+            inst.observe('api_deserialize_seconds', time.time() - start, model=self.model.__name__)
+        if projection is not None and projection.deferred:
+            source = self._deferred_source()
+            for instance in instances:
+                instance._deferred = projection.deferred
+                instance._source = source
+        return instances
+
+    def _deferred_source(self):
+        """
+        The set deferred fields are loaded through, it keeps the url filters
+        and client of this one
+        """
+        source = self._clone()
+        source._limit_start = source._limit_stop = None
+        source._only, source._defer, source._prefetch = None, (), ()
+        return source
+
+    @property
+    def page_size(self):
+        """
+        Number of results to request per page, models can set _page_size = None
+        to fetch the whole list in one request
         """
-        response = self.send('get', self.build_url(), params=self.params, **kwargs)
+        return getattr(self.model, '_page_size', CHUNK_SIZE)
 
-        response_json = response.json()
+    def _fetch_page(self, url, params, **kwargs):
+        response = self.send('get', url, params=params, **kwargs)
+
+        response_json = codec.decode_response(response)
 
         #TODO - standardize the list response to a dict with objects
         # at the moment the api returns a list with no meta in a couple of places
         if isinstance(response_json, list):
-            data_list = response_json
-        else:
-            #TODO - make 'objects' configurable so we can have any api list structure
-            data_list = response_json.get('objects', response_json)
-            self._meta = Meta(**response_json.get('meta', {}))
+            return response_json, None
+        #TODO - make 'objects' configurable so we can have any api list structure
+        return response_json.get('objects', response_json), response_json.get('meta', {})
 
-        for data in data_list:
-            instance = self.model()
-            instance.deserialize(data)
-            yield instance
+    def _stream_page(self, url, params, **kwargs):
+        response = self.send('get', url, params=params, **kwargs)
+
+        def on_key(key, value):
+            if key == 'meta':
+                self._meta = Meta(**value)
+
+        def on_error(payload):
+            self._check_response(response, url, 'get', payload, content=data_list.tail)
+
+        data_list = JSONListStream(self._iter_content(response), on_key=on_key, on_error=on_error)
+        return data_list, None
+
+    def _iter_content(self, response):
+        try:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            response.close()
+
+    def _page_params(self, params, offset):
+        page_params = dict(params)
+        page_params['limit_start'] = offset
+        page_params['limit_stop'] = offset + self.page_size
+        if self._limit_stop is not None:
+            page_params['limit_stop'] = min(page_params['limit_stop'], self._limit_stop)
+        return page_params
+
+    def _next_page(self, url, params, page_params, data_list, meta, offset):
+        """
+        Returns the (url, params) of the next page or None if this was the last one
+        """
+        if not data_list:
+            return None
+        if self._limit_stop is not None and offset >= self._limit_stop:
+            return None
+        if meta and 'next' in meta:
+            if not meta['next']:
+                return None
+            return urljoin(url, meta['next']), None
+        if meta and meta.get('total_count') is not None and offset >= meta['total_count']:
+            return None
+        if page_params is None or len(data_list) != page_params['limit_stop'] - page_params['limit_start']:
+            # a short page is the last one and a long one means the api ignored the window
+            return None
+        if meta is None and isinstance(data_list, JSONListStream):
+            # a streamed list is yielded before it can be checked for repeats, see _pages
+            return None
+        return url, self._page_params(params, offset)
+
+    def _pages(self, **kwargs):
+        url = self.build_url()
+        params = self.params
+        streamed = kwargs.get('stream', False)
+        fetch = self._stream_page if streamed else self._fetch_page
+        if not self.page_size:
+            data_list, meta = fetch(url, params, **kwargs)
+            if meta is not None:
+                self._meta = Meta(**meta)
+            yield data_list
+            return
+
+        offset = self._limit_start or 0
+        page_params = self._page_params(params, offset)
+        pages = PageFetch(fetch, kwargs, background=PREFETCH_PAGES and not streamed)
+        pages.start(url, page_params, background=False)
+        first = None
+        try:
+            while True:
+                data_list, meta = pages.result()
+                if not streamed and data_list:
+                    if first is not None and data_list[0] == first:
+                        # a page starting with the previous page's first row means
+                        # the api ignored the window, it has sent every row already
+                        return
+                    first = data_list[0]
+                rows = data_list
+                if self._limit_stop is not None:
+                    # apis that ignore the window can send rows past the slice
+                    rows = itertools.islice(data_list, max(self._limit_stop - offset, 0))
+                    if not streamed:
+                        rows = list(rows)
+                if streamed:
+                    # a streamed page has to be read before we know if there is another
+                    yield rows
+                    meta = data_list.extra.get('meta')
+                offset += len(data_list)
+                next_page = self._next_page(url, params, page_params, data_list, meta, offset)
+                if next_page is not None:
+                    page_url, page_params = next_page
+                    pages.start(page_url, page_params)
+                if not streamed:
+                    # meta is set as each page is used, not when it arrives
+                    if meta is not None:
+                        self._meta = Meta(**meta)
+                    yield rows
+                if next_page is None:
+                    return
+        finally:
+            pages.close()
 
     def set_limits(self, start, stop):
+        """
+        Limit to start:stop of the current limits, so slices of slices work
+        """
+        offset = self._limit_start or 0
+        if stop is not None:
+            stop += offset
+            if self._limit_stop is not None:
+                stop = min(stop, self._limit_stop)
+        else:
+            stop = self._limit_stop
+        if start is not None:
+            start += offset
+            if self._limit_stop is not None:
+                start = min(start, self._limit_stop)
+        else:
+            start = self._limit_start
         self._limit_start = start
         self._limit_stop = stop
 
     def filter(self, **kwargs):
-        self._token = kwargs.pop('token', self._token)
-        self._filters.update(kwargs)
-        return self
+        """
+        Returns a new set with the filters added, this one is unchanged
+        """
+        clone = self._clone(kwargs.pop('token', None), kwargs.pop('client', None))
+        # filters are shared between clones and copied when changed
+        clone._filters = dict(self._filters, **kwargs)
+        return clone
 
     def all(self, **kwargs):
-        self._token = kwargs.pop('token', self._token)
-        return self
+        return self._clone(kwargs.pop('token', None), kwargs.pop('client', None))
 
+    def using(self, client):
+        """
+        Returns a new set sending its requests with client
+        """
+        return self._clone(client=client)
+
+    def only(self, *fields):
+        """
+        Only fetch and deserialize these fields (and id), the others are
+        fetched with one GET when one of them is first read
+        """
+        clone = self._clone()
+        clone._only = tuple(fields)
+        return clone
+
+    def defer(self, *fields):
+        """
+        Leave these fields out until one of them is first read
+        """
+        clone = self._clone()
+        clone._defer = self._defer + tuple(fields)
+        return clone
+
+    @property
+    def projection(self):
+        if self._only is None and not self._defer:
+            return None
+        return Projection(self.model, self._only, self._defer)
+
+    def prefetch_related(self, *names):
+        """
+        Load the named relations from the model's _relations for every result,
+        embedded by the api if the model has an _expand_param or fetched for
+        each page of results in batches or in parallel
+        """
+        relations = self.model._relations or {}
+        for name in names:
+            if name not in relations:
+                raise ResourceSetException('%s has no relation %s' % (self.model.__name__, name))
+        clone = self._clone()
+        clone._prefetch = self._prefetch + tuple(name for name in names if name not in self._prefetch)
+        return clone
+
+    def _prefetch_related(self, instances, max_workers=BULK_WORKERS):
+        for name in self._prefetch:
+            relation = self.model._relations[name]
+            todo = []
+            for instance in instances:
+                value = getattr(instance, name, None)
+                related = relation.from_data(value) if value is not None else None
+                if related is None:
+                    todo.append(instance)
+                else:
+                    setattr(instance, name, related)
+            if todo:
+                relation.prefetch(self, name, todo, max_workers)
+        return instances
+
+    def _related_resource(self, model):
+        """
+        A ResourceSet for a related model sharing this one's client and components
+        """
+        return ResourceSet(model, client=self._client, pool=self._pool, cache=self._cache,
+                           retry_policy=self._retry_policy, circuit_breakers=self._circuit_breakers,
+                           limits=self._limits)
+
+    def _expand_params(self):
+        expand_param = getattr(self.model, '_expand_param', None)
+        if expand_param and self._prefetch:
+            return {expand_param: ','.join(self._prefetch)}
+        return {}
+
+    @per_call_client
     def get(self, pk=None, slug=None, code=None, **kwargs):
-        self._token = kwargs.pop('token', self._token)
         lookup = pk or slug or code
-        if not lookup and not self._token:
+        if not lookup and not self.client.token:
             raise ResourceSetException('You need to specify a pk, slug, code or a token to use get()')
         url = self.build_url(lookup=lookup)
 
+        extra_params = self._extra_params()
+        if extra_params:
+            kwargs['params'] = dict(kwargs.get('params') or {}, **extra_params)
         response = self.send('get', url, **kwargs)
-        data = response.json()
-        instance = self.model()
-        instance.deserialize(data)
+        data = codec.decode_response(response)
+        instance = self._deserialize_many([data])[0]
+        if self._prefetch:
+            self._prefetch_related([instance])
         return instance
 
+    @per_call_client
+    def in_bulk(self, pks, max_workers=BULK_WORKERS, on_error=BULK_SKIP, **kwargs):
+        """
+        Returns an ordered dict of {pk: instance} for the given pks
+
+        If the model has a _bulk_lookup filter (eg 'id__in') the pks are fetched
+        with filter requests of CHUNK_SIZE pks, otherwise each pk is fetched with
+        get() on at most max_workers threads.
+
+        on_error decides what happens to a pk whose request failed, with an
+        ApiException or a requests error once it ran out of retries, BULK_RAISE raises it, BULK_SKIP leaves the pk out and BULK_NONE maps it to None.
+        """
+        if on_error not in (BULK_RAISE, BULK_SKIP, BULK_NONE):
+            raise ResourceSetException('on_error must be one of %s, %s or %s' % (BULK_RAISE, BULK_SKIP, BULK_NONE))
+        pks = list(OrderedDict.fromkeys(pks))
+        lookup = getattr(self.model, '_bulk_lookup', None)
+        if lookup:
+            chunks = [pks[i:i + CHUNK_SIZE] for i in range(0, len(pks), CHUNK_SIZE)]
+            fetched = self._run_bulk(lambda chunk: self._bulk_filter(lookup, chunk, **kwargs), chunks, max_workers)
+        else:
+            fetched = self._run_bulk(lambda pk: [self._bulk_get(pk, **kwargs)], pks, max_workers)
+        fetched = dict(result for results in fetched for result in results)
+
+        instances = OrderedDict()
+        for pk in pks:
+            instance = fetched[pk]
+            if isinstance(instance, Exception):
+                if on_error == BULK_RAISE:
+                    raise instance
+                if on_error == BULK_SKIP:
+                    continue
+                instance = None
+            instances[pk] = instance
+        return instances
+
+    def _run_bulk(self, func, items, max_workers):
+        if len(items) < 2 or max_workers < 2:
+            return [func(item) for item in items]
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(min(max_workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _bulk_get(self, pk, **kwargs):
+        try:
+            return pk, self._clone().get(pk=pk, **kwargs)
+        except request_errors() as e:
+            return pk, e
+
+    def _bulk_filter(self, lookup, pks, **kwargs):
+        clone = self._clone()
+        clone._filters = dict(self._filters)
+        clone._filters[lookup] = ','.join(six.text_type(pk) for pk in pks)
+        try:
+            by_pk = dict((six.text_type(instance.pk), instance) for instance in clone.iterator(**kwargs))
+        except request_errors() as e:
+            return [(pk, e) for pk in pks]
+        return [(pk, by_pk.get(six.text_type(pk), NotFoundException('Resource not found.'))) for pk in pks]
+
+    @per_call_client
+    def bulk_create(self, instances, max_workers=BULK_WORKERS, **kwargs):
+        """
+        POST every instance, returns a BulkReport
+
+        Models with _batch_writes send CHUNK_SIZE instances per request to the
+        list endpoint, otherwise each instance is posted on at most max_workers threads.
+        """
+        instances = list(instances)
+        payloads = [self.model.validate_data(instance.serialize()) for instance in instances]
+        if getattr(self.model, '_batch_writes', False):
+            report = self._batch_write(instances, payloads, 'objects', max_workers, **kwargs)
+        else:
+            report = self._bulk_write(instances, payloads, self._create_one, max_workers, **kwargs)
+        for instance in report.succeeded:
+            instance.mark_saved()
+        return report
+
+    @per_call_client
+    def bulk_update(self, instances, fields=None, max_workers=BULK_WORKERS, **kwargs):
+        """
+        PATCH the changed fields of every instance, limited to fields if given,
+        instances with nothing to send are skipped. Returns a BulkReport.
+        """
+        instances = list(instances)
+        payloads = []
+        for instance in instances:
+            data = instance.serialize_changed()
+            if fields is not None:
+                data = dict((k, v) for k, v in data.items() if k in fields)
+            data = data and dict(self.model.validate_data(data))
+            if data:
+                data['id'] = instance.pk
+            payloads.append(data)
+        if getattr(self.model, '_batch_writes', False):
+            report = self._batch_write(instances, payloads, 'objects', max_workers, **kwargs)
+        else:
+            report = self._bulk_write(instances, payloads, self._update_one, max_workers, **kwargs)
+        for instance in report.succeeded:
+            instance.mark_saved(fields)
+        return report
+
+    @per_call_client
+    def bulk_delete(self, instances_or_pks, max_workers=BULK_WORKERS, **kwargs):
+        """
+        DELETE every instance or pk, returns a BulkReport
+        """
+        items = list(instances_or_pks)
+        pks = [getattr(item, 'pk', item) for item in items]
+        if getattr(self.model, '_batch_writes', False):
+            return self._batch_write(items, [self.build_url(lookup=pk) for pk in pks], 'deleted_objects',
+                                     max_workers, **kwargs)
+        return self._bulk_write(items, pks, self._delete_one, max_workers, **kwargs)
+
+    def _bulk_write(self, items, payloads, write, max_workers, **kwargs):
+        report = BulkReport()
+        todo = [(i, payload) for i, payload in enumerate(payloads) if payload]
+
+        def run(job):
+            try:
+                write(job[1], **kwargs)
+            except request_errors() as e:
+                return e
+
+        errors = self._run_bulk(run, todo, max_workers)
+        results = dict((i, error) for (i, payload), error in zip(todo, errors))
+        for i, item in enumerate(items):
+            report.add(item, results.get(i), skipped=i not in results)
+        return report
+
+    def _batch_write(self, items, payloads, key, max_workers, **kwargs):
+        """
+        PATCH the list endpoint with CHUNK_SIZE payloads at a time, a failed
+        request fails every item in it
+        """
+        report = BulkReport()
+        todo = [(i, payload) for i, payload in enumerate(payloads) if payload]
+        chunks = [todo[i:i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+
+        def run(chunk):
+            data = {'objects': []}
+            data[key] = [payload for i, payload in chunk]
+            try:
+                response = self._clone().send('patch', self.build_url(), data=data, **kwargs)
+                if response.status_code not in [200, 202, 204]:
+                    raise ResourceSetException('Expected status code 200, 202, 204, got %s' % response.status_code)
+            except request_errors() as e:
+                return e
+
+        errors = self._run_bulk(run, chunks, max_workers)
+        results = dict((i, error) for chunk, error in zip(chunks, errors) for i, payload in chunk)
+        for i, item in enumerate(items):
+            report.add(item, results.get(i), skipped=i not in results)
+        return report
+
+    def _create_one(self, data, **kwargs):
+        response = self._clone().send('post', self.url, data=codec.dumps(data), **kwargs)
+        if response.status_code != 201:
+            raise ResourceSetException('Expected status code 201, got %s' % (response.status_code))
+
+    def _update_one(self, data, **kwargs):
+        data = dict(data)
+        url = self.build_url(lookup=data.pop('id'))
+        response = self._clone().send('patch', url, data=codec.dumps(data), **kwargs)
+        if response.status_code not in [200, 201, 202]:
+            raise ResourceSetException('Expected status code 200, 201, 202, got %s' % (response.status_code))
+
+    def _delete_one(self, pk, **kwargs):
+        response = self._clone().send('delete', self.build_url(lookup=pk), **kwargs)
+        if response.status_code not in DELETE_STATUS:
+            raise ResourceSetException('Expected status code %s, got %s' % (DELETE_STATUS, response.status_code))
+
+    @per_call_client
     def patch(self, instance, **kwargs):
-        self._token = kwargs.pop('token', self._token)
         url = self.build_url(lookup=instance.pk)
         data = self.model.validate_data(instance.serialize_changed())
         if data:
-            response = self.send('patch', url, data=json.dumps(data), **kwargs)
+            response = self.send('patch', url, data=codec.dumps(data), **kwargs)
             if response.status_code not in [200, 201, 202]:
                 raise ResourceSetException('Expected status code 200, 201, 202, got %s' % (response.status_code))
+            instance.mark_saved()
         return instance
 
+    @per_call_client
     def save(self, instance, **kwargs):
-        self._token = kwargs.pop('token', self._token)
         if instance.pk:
             return self.patch(instance)
         data = self.model.validate_data(instance.serialize())
-        response = self.send('post', self.url, data=json.dumps(data), **kwargs)
+        response = self.send('post', self.url, data=codec.dumps(data), **kwargs)
         if response.status_code != 201:
             raise ResourceSetException('Expected status code 201, got %s' % (response.status_code))
+        instance.mark_saved()
         return instance
 
+    @per_call_client
     def delete(self, instance, **kwargs):
-        self._token = kwargs.pop('token', self._token)
         url = self.build_url(lookup=instance.pk)
         response = self.send('delete', url, **kwargs)
         if response.status_code not in DELETE_STATUS:
             raise ResourceSetException('Expected status code %s, got %s' % (DELETE_STATUS, response.status_code))
         self._result_cache = None
+        self._count = None
 
     @property
     def url(self):
-        return self.model.url()
+        return self.client.url(self.model)
 
     @property
     def params(self):
-        data = {k: v for k, v in self._filters.iteritems() if '{%s}' % k not in self.url}
+        url = self.url
+        data = {k: v for k, v in self._filters.iteritems() if '{%s}' % k not in url}
         if self._limit_start:
             data['limit_start'] = self._limit_start
-        if self._limit_start:
+        if self._limit_stop is not None:
             data['limit_stop'] = self._limit_stop
+        data.update(self._extra_params())
         return data
 
+    def _extra_params(self):
+        """
+        The expand and fields params for prefetch_related and only / defer
+        """
+        params = self._expand_params()
+        fields_param = getattr(self.model, '_fields_param', None)
+        projection = self.projection
+        if fields_param and projection is not None and projection.param() is not None:
+            params[fields_param] = projection.param()
+        return params
+
+    @property
+    def client(self):
+        """
+        Client the set was given, else the model's _client, else the process default
+        """
+        return self._client or getattr(self.model, '_client', None) or client.get_default_client()
+
+    @property
+    def pool(self):
+        """
+        SessionPool used to send requests, defaults to the client's then the shared process pool
+        """
+        return self._pool or self.client.pool or session.get_default_pool()
+
+    @property
+    def retry_policy(self):
+        policy = self._retry_policy or self.client.retry_policy
+        if policy is None:
+            return resilience.get_default_policy()
+        return policy
+
+    @property
+    def circuit_breakers(self):
+        breakers = self._circuit_breakers or self.client.circuit_breakers
+        if breakers is None:
+            return resilience.get_default_breakers()
+        return breakers
+
+    @property
+    def limits(self):
+        url_limits = self._limits or self.client.limits
+        if url_limits is None:
+            url_limits = limits.get_default_limits()
+        return url_limits
+
+    @property
+    def cache(self):
+        """
+        Response cache, defaults to the client's then the shared process cache
+        """
+        response_cache = self._cache or self.client.cache
+        if response_cache is None:
+            return cache.get_default_cache()
+        return response_cache
+
+    @property
+    def cache_ttl(self):
+        """
+        Seconds a GET response for this model is fresh, None disables caching
+        """
+        return getattr(self.model, '_cache_ttl', None)
+
     @property
     def meta(self):
-        if self._meta is None:
-            # force lazy load to load
-            len(self)
+        if self._meta is None and self._result_cache is None and not self._probed:
+            # the meta of a one result request, apis that send a bare list have none
+            self._probe()
         return self._meta
 
     def query_string(self):
@@ -228,6 +1062,7 @@ class ResourceSet(object):
                 url = url.replace('{%s}' % key, unicode(val))
         return url
 
+    @per_call_client
     def send(self, method, url, **kwargs):
         """
         Send the request and return the result
@@ -236,33 +1071,150 @@ class ResourceSet(object):
 
         If the API is in debug, we add the traceback to a new exception so it can be seen on the front end
         """
+        inst = instrumentation.get_instrumentation()
+        if not inst.enabled:
+            return self._send(method, url, **kwargs)
 
-        self._token = kwargs.pop('token', self._token)
+        labels = {'model': self.model.__name__, 'method': method}
+        inst.pre_request(self, method, url, kwargs)
+        response = None
+        error = None
+        start = time.time()
+        try:
+            with inst.span('api.request', url=url, **labels):
+                response = self._send(method, url, **kwargs)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.time() - start
+            status = response.status_code if response is not None else type(error).__name__
+            inst.increment('api_requests_total', status=status, **labels)
+            inst.observe('api_request_seconds', elapsed, **labels)
+            if response is not None and not kwargs.get('stream'):
+                inst.observe('api_response_bytes', len(response.content or b''), **labels)
+            inst.post_request(self, method, url, response, elapsed, error)
 
-        headers = kwargs.pop('headers', {})
-        if self._token:
-            headers['AUTHORIZATION'] = 'JWT %s' % self._token
+    def _metric(self, name, **labels):
+        inst = instrumentation.get_instrumentation()
+        if inst.enabled:
+            inst.increment(name, model=self.model.__name__, **labels)
+
+    def _send(self, method, url, **kwargs):
+        call_client = self.client
+        headers = call_client.request_headers(kwargs.pop('headers', None))
         data = kwargs.pop('data', None)
         if isinstance(data, (dict, list)):
-            data = json.dumps(data)
+            data = codec.dumps(data)
         if data and method in ['put', 'post']:
             headers.update({
                 'Content-type': 'application/json',
                 'Accept': 'text/plain'
             })
-        response = requests.request(method, url, headers=headers, data=data, **kwargs)
-        error_message = None
-        error = None
+
+        cache_key = None
+        entry = None
+        streamed = kwargs.get('stream', False)
+        if method == 'get' and self.cache_ttl is not None and not streamed:
+            cache_key = cache.make_key(method, url, kwargs.get('params'), call_client.auth_key)
+            entry = self.cache.get(cache_key)
+            if entry is not None and entry.is_fresh():
+                self._metric('api_cache_hits_total')
+                return entry.to_response()
+            self._metric('api_cache_misses_total')
+            if entry is not None:
+                headers.update(entry.revalidation_headers())
+
+        if method == 'get' and COALESCE_GETS and not streamed:
+            key = cache_key or cache.make_key(method, url, kwargs.get('params'), call_client.auth_key)
+            return coalesce.get_default_group().do(
+                key, self._request, method, url, cache_key, entry, headers=headers, data=data, **kwargs)
+        return self._request(method, url, cache_key, entry, headers=headers, data=data, **kwargs)
+
+    def _request(self, method, url, cache_key=None, entry=None, **kwargs):
+        """
+        Make the http request, raise any api error and store the response in the cache
+        """
+        response = self._send_with_retries(method, url, **kwargs)
+        if entry is not None and response.status_code == 304:
+            self._metric('api_cache_revalidations_total')
+            entry.refresh(self.cache_ttl)
+            self.cache.set(cache_key, entry)
+            return entry.to_response()
+
+        if kwargs.get('stream') and response.status_code < 400:
+            # streamed bodies are checked for errors as they are parsed, see _stream_page
+            return response
+
         try:
-            response_json = response.json()
+            response_json = codec.decode_response(response)
         except ValueError:
             response_json = None
-        # If the API is in debug, add the traceback to a new exception so it can be seen on the front end
+        self._check_response(response, url, method, response_json)
+
+        if cache_key is not None and response.status_code == 200:
+            self.cache.set(cache_key, cache.CacheEntry.from_response(url, response, self.cache_ttl))
+        elif method != 'get' and self.cache_ttl is not None:
+            # writes make any cached item or list of this resource stale
+            self.cache.invalidate(self.build_url())
+        return response
+
+    def _send_with_retries(self, method, url, **kwargs):
+        """
+        Make the http request, retrying as the retry policy allows while the
+        host's circuit breaker is closed, each attempt waits on the model's or url's limiter
+        """
+        import requests
+
+        policy = self.retry_policy
+        breaker = self.circuit_breakers.get(url)
+        limiter = self.limits.get(url, self.model)
+        request_timeout = kwargs.pop('timeout', None)
+        start = time.time()
+        attempt = 0
+        while True:
+            breaker.before_request(url)
+            timeout = request_timeout or policy.attempt_timeout(start)
+            try:
+                with limiter.acquire() if limiter is not None else limits.no_limit():
+                    response = self.pool.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                breaker.record_failure()
+                delay = policy.delay(method, attempt, start)
+                if delay is None:
+                    raise
+            except Exception:
+                # a client side error is not the host's failure, but a half open breaker is waiting on it
+                breaker.release_trial()
+                raise
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                delay = policy.delay(method, attempt, start, response)
+                if delay is None:
+                    return response
+                response.close()
+            self._metric('api_retries_total', method=method)
+            time.sleep(delay)
+            attempt += 1
+
+    def _check_response(self, response, url, method, response_json, content=None):
+        """
+        Raise the api exception for an error response
+
+        If the API is in debug, we add the traceback to a new exception so it can be seen on the front end
+        """
+        error_message = None
+        error = None
         if response.status_code >= 400 or response_json is None or \
                 'traceback' in response_json or 'error' in response_json:
             error = 'Unknown error'
             traceback = 'No traceback'
-            content = response.content
+            if content is None:
+                content = response.content
             try:
                 error = response_json.get('error', error)
                 traceback = response_json.get('traceback', traceback)
@@ -279,12 +1231,20 @@ class ResourceSet(object):
             e = get_exception_class(response.status_code, error)(error_message)
             e.message = error
             raise e
-        return response
 
-    def _clone(self):
-        clone = self.__class__(self.model)
-        clone._token = self._token
+    def _clone(self, token=None, client=None):
+        """
+        Copy of the set, using client and / or a client with token if given
+        """
+        clone = self.__class__(self.model, client=client or self._client, pool=self._pool, cache=self._cache,
+                               retry_policy=self._retry_policy, circuit_breakers=self._circuit_breakers,
+                               limits=self._limits)
+        if token is not None:
+            clone._client = clone.client.with_token(token)
         clone._limit_start = self._limit_start
         clone._limit_stop = self._limit_stop
         clone._filters = self._filters
+        clone._prefetch = self._prefetch
+        clone._only = self._only
+        clone._defer = self._defer
         return clone
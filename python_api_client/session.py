@@ -0,0 +1,244 @@
+"""
+Pooled, keep-alive HTTP sessions shared by every ResourceSet.
+
+A SessionPool keeps one requests.Session per host (scheme + netloc) so
+connections to the api are reused instead of being opened for every request.
+Sessions are shared by the whole process by default or can be kept per thread,
+the sessions of threads that have exited are closed when the next session is
+opened or the stats are read. requests is imported when the first session is
+opened.
+"""
+import threading
+import time
+import weakref
+
+from six.moves.urllib.parse import urlparse
+
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+MAX_RETRIES = 0
+POOL_BLOCK = False
+
+PROCESS_SCOPE = 'process'
+THREAD_SCOPE = 'thread'
+
+
+class PoolStats(object):
+    """
+    Thread safe counters for the time spent waiting on a free connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def add_wait(self, elapsed):
+        with self._lock:
+            self.waits += 1
+            self.wait_time += elapsed
+
+
+class PooledAdapterMixin(object):
+    """
+    Mixed in to requests' HTTPAdapter to keep track of the urllib3 pools it
+    hands out so we can report how often connections are reused, see
+    get_adapter_class.
+    """
+
+    def __init__(self, stats=None, *args, **kwargs):
+        self.stats = stats or PoolStats()
+        self.connection_pools = []
+        super(PooledAdapterMixin, self).__init__(*args, **kwargs)
+
+    def get_connection(self, url, proxies=None):
+        pool = super(PooledAdapterMixin, self).get_connection(url, proxies)
+        if pool not in self.connection_pools:
+            self._time_connections(pool)
+            self.connection_pools.append(pool)
+        return pool
+
+    def _time_connections(self, pool):
+        get_conn = pool._get_conn
+        stats = self.stats
+
+        def _get_conn(timeout=None):
+            start = time.time()
+            try:
+                return get_conn(timeout=timeout)
+            finally:
+                stats.add_wait(time.time() - start)
+
+        pool._get_conn = _get_conn
+
+    def close(self):
+        super(PooledAdapterMixin, self).close()
+        self.connection_pools = []
+
+
+_adapter_class = None
+
+
+def get_adapter_class():
+    """
+    The PooledAdapter class, built the first time a session is opened
+    """
+    global _adapter_class
+    if _adapter_class is None:
+        from requests.adapters import HTTPAdapter
+
+        _adapter_class = type('PooledAdapter', (PooledAdapterMixin, HTTPAdapter), {})
+    return _adapter_class
+
+
+class SessionPool(object):
+    """
+    Hands out keep-alive sessions per host.
+
+    scope can be PROCESS_SCOPE (one session per host shared by all threads) or
+    THREAD_SCOPE (one session per host per thread).
+    """
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 max_retries=MAX_RETRIES, pool_block=POOL_BLOCK, keep_alive=True,
+                 scope=PROCESS_SCOPE):
+        if scope not in (PROCESS_SCOPE, THREAD_SCOPE):
+            raise ValueError('scope must be %r or %r' % (PROCESS_SCOPE, THREAD_SCOPE))
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.scope = scope
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = {}
+        # (thread the session is for or None, adapter)
+        self._adapters = []
+        # requests and connections of the sessions closed by _prune
+        self._closed_requests = 0
+        self._closed_connections = 0
+
+    def _session_map(self):
+        if self.scope == THREAD_SCOPE:
+            try:
+                return self._local.sessions
+            except AttributeError:
+                self._local.sessions = {}
+                return self._local.sessions
+        return self._sessions
+
+    def _new_session(self):
+        import requests
+
+        session = requests.Session()
+        adapter = get_adapter_class()(self.stats, pool_connections=self.pool_connections,
+                                pool_maxsize=self.pool_maxsize, max_retries=self.max_retries,
+                                pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        owner = None
+        if self.scope == THREAD_SCOPE:
+            owner = weakref.ref(threading.current_thread())
+        self._prune()
+        self._adapters.append((owner, adapter))
+        return session
+
+    def _prune(self):
+        """
+        Close the sessions of threads that have exited, called with _lock held
+        """
+        adapters = []
+        for owner, adapter in self._adapters:
+            thread = owner() if owner is not None else None
+            if owner is None or (thread is not None and thread.is_alive()):
+                adapters.append((owner, adapter))
+                continue
+            requests_sent, connections, idle = _adapter_counts(adapter)
+            self._closed_requests += requests_sent
+            self._closed_connections += connections
+            adapter.close()
+        self._adapters = adapters
+
+    def get_session(self, url):
+        parsed = urlparse(url)
+        host = '%s://%s' % (parsed.scheme, parsed.netloc)
+        sessions = self._session_map()
+        try:
+            return sessions[host]
+        except KeyError:
+            with self._lock:
+                if host not in sessions:
+                    sessions[host] = self._new_session()
+                return sessions[host]
+
+    def request(self, method, url, **kwargs):
+        return self.get_session(url).request(method, url, **kwargs)
+
+    def get_stats(self):
+        """
+        requests - requests sent over pooled connections
+        connections - connections opened
+        reused - requests that reused an already open connection
+        open - idle connections currently held in the pools
+        waits / wait_time - times (and total seconds) spent getting a connection
+        """
+        with self._lock:
+            self._prune()
+            adapters = [adapter for owner, adapter in self._adapters]
+            requests_sent, connections, idle = self._closed_requests, self._closed_connections, 0
+        for adapter in adapters:
+            counts = _adapter_counts(adapter)
+            requests_sent += counts[0]
+            connections += counts[1]
+            idle += counts[2]
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(requests_sent - connections, 0),
+            'open': idle,
+            'waits': self.stats.waits,
+            'wait_time': self.stats.wait_time,
+        }
+
+    def close(self):
+        with self._lock:
+            for owner, adapter in self._adapters:
+                adapter.close()
+            self._adapters = []
+            self._sessions = {}
+            self._local = threading.local()
+
+
+def _adapter_counts(adapter):
+    """
+    (requests, connections, idle connections) of an adapter's pools
+    """
+    requests_sent = connections = idle = 0
+    for pool in list(adapter.connection_pools):
+        requests_sent += pool.num_requests
+        connections += pool.num_connections
+        if pool.pool is not None:
+            idle += len([c for c in list(pool.pool.queue) if c is not None])
+    return requests_sent, connections, idle
+
+
+_default_pool = SessionPool()
+
+
+def get_default_pool():
+    return _default_pool
+
+
+def configure(**kwargs):
+    """
+    Replace the process wide pool used by ResourceSets that are not given one.
+    Accepts the same arguments as SessionPool.
+    """
+    global _default_pool
+    old_pool, _default_pool = _default_pool, SessionPool(**kwargs)
+    old_pool.close()
+    return _default_pool
@@ -0,0 +1,160 @@
+"""
+Snapshots of evaluated ResourceSets in a compact binary file.
+
+The file holds a json header (the request key, meta, the pk of each row and
+when the results were fetched), an index of row offsets and the rows as
+json. Loading memory maps the file and a row is only decoded and
+deserialized when it is first used, so a large reference collection is
+available at startup without paging through the api.
+
+    MAGIC | header length (uint32) | header | row offsets (uint64 * rows + 1) | rows
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from .exceptions import ResourceSetException
+
+MAGIC = b'PACSNAP1'
+LENGTH = struct.Struct('<I')
+OFFSET = struct.Struct('<Q')
+
+
+def _encode_default(value):
+    # dates are written as iso strings and parsed again when the row is loaded
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def encode_row(instance):
+    return json.dumps(instance.serialize(), default=_encode_default, separators=(',', ':')).encode('utf-8')
+
+
+def write(path, header, rows):
+    """
+    Write the header and encoded rows, the file is replaced atomically
+    """
+    rows = list(rows)
+    header = json.dumps(header, default=_encode_default).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(LENGTH.pack(len(header)))
+            f.write(header)
+            offset = 0
+            for row in rows:
+                f.write(OFFSET.pack(offset))
+                offset += len(row)
+            f.write(OFFSET.pack(offset))
+            for row in rows:
+                f.write(row)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class SnapshotRows(object):
+    """
+    Read only sequence of instances backed by a memory mapped snapshot,
+    each row is deserialized on first access
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ResourceSetException('%s is not a snapshot file' % path)
+        start = len(MAGIC) + LENGTH.size
+        length = LENGTH.unpack_from(self._map, len(MAGIC))[0]
+        self.header = json.loads(self._map[start:start + length].decode('utf-8'))
+        self._count = self.header['count']
+        self._index = start + length
+        self._data = self._index + OFFSET.size * (self._count + 1)
+        self._instances = [None] * self._count
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, i):
+        """
+        The encoded row, without decoding it
+        """
+        start, stop = OFFSET.unpack_from(self._map, self._index + OFFSET.size * i)[0], \
+            OFFSET.unpack_from(self._map, self._index + OFFSET.size * (i + 1))[0]
+        return self._map[self._data + start:self._data + stop]
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[i] for i in range(*k.indices(self._count))]
+        if k < 0:
+            k += self._count
+        if not 0 <= k < self._count:
+            raise IndexError('snapshot row out of range')
+        instance = self._instances[k]
+        if instance is None:
+            instance = self.model.deserialize_many([json.loads(self.raw(k).decode('utf-8'))])[0]
+            self._instances[k] = instance
+        return instance
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        self._map.close()
+
+
+def dump(path, resource_set, created):
+    """
+    Write the evaluated resource_set, created is when its results were fetched
+    """
+    instances = resource_set._result_cache
+    meta = resource_set._meta.__dict__ if resource_set._meta is not None else None
+    if isinstance(instances, SnapshotRows):
+        # rows that were not used are copied without decoding them
+        pks = instances.header['pks']
+        rows = (instances.raw(i) if instances._instances[i] is None else encode_row(instances._instances[i])
+                for i in range(len(instances)))
+    else:
+        pks = [instance.pk for instance in instances]
+        rows = (encode_row(instance) for instance in instances)
+    header = {
+        'model': resource_set.model.__name__,
+        'key': resource_set.request_key(),
+        'created': created,
+        'meta': meta,
+        'count': len(instances),
+        'pks': pks,
+    }
+    write(path, header, rows)
+
+
+def merge(path, rows, changed, created):
+    """
+    Write a snapshot with the changed instances replacing the rows with the
+    same pk and new ones added at the end
+    """
+    header = dict(rows.header)
+    pks = list(header['pks'])
+    positions = dict((pk, i) for i, pk in enumerate(pks))
+    encoded = [None] * len(pks)
+    for instance in changed:
+        if instance.pk in positions:
+            encoded[positions[instance.pk]] = encode_row(instance)
+        else:
+            positions[instance.pk] = len(pks)
+            pks.append(instance.pk)
+            encoded.append(encode_row(instance))
+    header.update({'created': created, 'count': len(pks), 'pks': pks})
+    if header.get('meta') and 'total_count' in header['meta']:
+        header['meta'] = dict(header['meta'], total_count=len(pks))
+    write(path, header, (row if row is not None else rows.raw(i) for i, row in enumerate(encoded)))
@@ -0,0 +1,176 @@
+"""
+Incremental parsing of list responses.
+
+JSONListStream reads a response body chunk by chunk and yields the items of
+the list (or of the 'objects' list in a dict body) as soon as each one has
+arrived, so only the item being parsed is held in memory. Other top level
+keys, such as meta, are handed to on_key as they are parsed.
+"""
+import codecs
+import json
+
+import six
+
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+
+class JSONListStream(object):
+    """
+    Iterate over the items of a json list read from chunks of bytes.
+
+    on_key(key, value) is called for every top level key of a dict body other
+    than objects_key. If a key in error_keys is found the rest of the body is
+    read and on_error(payload) is called with the top level keys, it should
+    raise. on_error(None) is called if the body is not valid json.
+    """
+
+    def __init__(self, chunks, objects_key='objects', on_key=None, on_error=None,
+                 error_keys=('error', 'traceback')):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = u''
+        self._pos = 0
+        self._finished = False
+        self.objects_key = objects_key
+        self.on_key = on_key
+        self.on_error = on_error
+        self.error_keys = error_keys
+        self.extra = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _read(self):
+        """
+        Read the next chunk in to the buffer, returns False at the end of the body
+        """
+        if self._finished:
+            return False
+        if self._pos > len(self._buffer) // 2:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._finished = True
+            self._buffer += self._decoder.decode(b'', final=True)
+            return False
+        self._buffer += self._decoder.decode(chunk)
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._read():
+                return
+
+    def _peek(self):
+        self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            raise ValueError('Unexpected end of json')
+        return self._buffer[self._pos]
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError('Expected %s at %s, got %r' % (' or '.join(chars), self._pos, char))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """
+        Decode the next complete json value from the buffer
+        """
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._read():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end >= len(self._buffer) and self._read():
+                continue
+            self._pos = end
+            return value
+
+    def _items(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            self.count += 1
+            if self._expect(',]') == ']':
+                return
+
+    def _dict(self):
+        """
+        Parse the top level dict, yielding the objects list as it is read
+        """
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self.objects_key and self._peek() == '[':
+                for item in self._items():
+                    yield item
+            else:
+                value = self._value()
+                self.extra[key] = value
+                if key in self.error_keys:
+                    self._drain()
+                    if self.on_error is not None:
+                        self.on_error(self.extra)
+                elif self.on_key is not None:
+                    self.on_key(key, value)
+            if self._expect(',}') == '}':
+                return
+
+    def _drain(self):
+        while self._expect(',}') == ',':
+            key = self._value()
+            self._expect(':')
+            self.extra[key] = self._value()
+        self._pos -= 1
+
+    def __iter__(self):
+        try:
+            if self._expect('[{') == '[':
+                self._pos -= 1
+                items = self._items()
+            else:
+                items = self._dict()
+            for item in items:
+                yield item
+            self._skip_whitespace()
+            if self._pos < len(self._buffer):
+                raise ValueError('Extra data after json at %s' % self._pos)
+        except ValueError:
+            if self.on_error is not None:
+                self.on_error(None)
+            raise
+
+    @property
+    def tail(self):
+        """
+        The part of the body that has been read but not parsed, for error messages
+        """
+        return self._buffer[self._pos:]
+
+
+def iter_json_list(content, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    Stream the items of a json list from a byte string, mainly for testing
+    """
+    chunks = (content[i:i + chunk_size] for i in six.moves.range(0, len(content), chunk_size))
+    return JSONListStream(chunks, **kwargs)
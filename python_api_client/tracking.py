@@ -0,0 +1,169 @@
+"""
+Change tracking for nested dicts and lists in model fields.
+
+A deserialized field holding a dict or list is given a TrackedDict or
+TrackedList while the snapshot keeps the original. Each level is only copied
+when it is read, so the snapshot is never changed and changing the value at
+any depth marks the field dirty without deep copying or comparing the whole
+structure.
+
+Every value wrapped by track() starts a new tree, values nested in it are
+copied in to that tree when they are read, including ones from another tree,
+so trees never share a dict or list that can be changed. Copies and values
+removed from a tracked value are given a tree of their own that marks nothing
+dirty.
+"""
+
+
+def track(value, owner, field, root=None):
+    """
+    Wrap a dict or list so changes to it mark field dirty on owner
+    """
+    if type(value) in (dict, TrackedDict):
+        return TrackedDict(value, owner, field, root)
+    if type(value) in (list, TrackedList):
+        return TrackedList(value, owner, field, root)
+    return value
+
+
+def detach(value):
+    """
+    A copy of a dict or list taken from a tracked value, changing it changes nothing else
+    """
+    return track(value, DETACHED, None)
+
+
+class Detached(object):
+    """
+    Owner of values no longer in a model field
+    """
+
+    def mark_dirty(self, field):
+        pass
+
+
+DETACHED = Detached()
+
+
+def _tracked_method(name, base):
+    method = getattr(base, name)
+
+    def changed(self, *args, **kwargs):
+        self._changed()
+        return method(self, *args, **kwargs)
+    changed.__name__ = name
+    return changed
+
+
+class Tracked(object):
+    """
+    What TrackedDict and TrackedList share, _root is the tree the value is in
+    """
+
+    def _init_tracked(self, owner, field, root):
+        self._owner = owner
+        self._field = field
+        self._root = root if root is not None else self
+
+    def _changed(self):
+        self._owner.mark_dirty(self._field)
+
+    def _in_tree(self, value):
+        """
+        value copied in to this tree if it's a dict or list from anywhere else
+        """
+        if type(value) in (dict, list) or (isinstance(value, Tracked) and value._root is not self._root):
+            return track(value, self._owner, self._field, self._root)
+        return value
+
+
+class TrackedDict(Tracked, dict):
+
+    def __init__(self, value, owner, field, root=None):
+        dict.__init__(self, value)
+        self._init_tracked(owner, field, root)
+
+    def _tracked(self, key, value):
+        tracked = self._in_tree(value)
+        if tracked is not value:
+            dict.__setitem__(self, key, tracked)
+        return tracked
+
+    def __getitem__(self, key):
+        return self._tracked(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def setdefault(self, key, default=None):
+        self._changed()
+        dict.setdefault(self, key, default)
+        return self[key]
+
+    def pop(self, key, *default):
+        self._changed()
+        return detach(dict.pop(self, key, *default))
+
+    def popitem(self):
+        self._changed()
+        key, value = dict.popitem(self)
+        return key, detach(value)
+
+    def copy(self):
+        return detach(self)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class TrackedList(Tracked, list):
+
+    def __init__(self, value, owner, field, root=None):
+        list.__init__(self, value)
+        self._init_tracked(owner, field, root)
+
+    def __getitem__(self, index):
+        value = list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        tracked = self._in_tree(value)
+        if tracked is not value:
+            list.__setitem__(self, index, tracked)
+        return tracked
+
+    def __getslice__(self, start, stop):
+        return self[slice(start, stop)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def pop(self, *index):
+        self._changed()
+        return detach(list.pop(self, *index))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+for _name in ('__setitem__', '__delitem__', 'clear', 'update'):
+    setattr(TrackedDict, _name, _tracked_method(_name, dict))
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__', '__imul__',
+              'append', 'extend', 'insert', 'remove', 'reverse', 'sort'):
+    if hasattr(list, _name):
+        setattr(TrackedList, _name, _tracked_method(_name, list))
@@ -1,13 +1,39 @@
 import SimpleHTTPServer
 import SocketServer
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import threading
 import unittest
 import time
 
-from mock import patch
+import pytz
+import requests
+from mock import Mock, patch
 
-from python_api_client.exceptions import NotFoundException, CantSaveException
-from python_api_client.models import Model, BASE_API_URL
+from python_api_client.exceptions import (ApiException, CircuitOpenException, NotFoundException, ResourceSetException,
+                                         CantSaveException, RateLimitedException)
+from python_api_client.resilience import CLOSED, HALF_OPEN, CircuitBreakers, RetryPolicy
+from python_api_client import aio
+from python_api_client.aio import gather
+from python_api_client.cache import CacheEntry, MemoryCache, SqliteCache
+from python_api_client.client import Client
+from python_api_client.coalesce import SingleFlight
+from python_api_client import codec, conf, models
+from python_api_client.dates import parse_datetime
+from python_api_client.stream import iter_json_list
+from python_api_client.instrumentation import MetricsRegistry, get_instrumentation, null_span
+from python_api_client.limits import FileTokenBucket, Limits, TokenBucket
+from python_api_client.models import Model
+from python_api_client.relations import ForeignKey, Nested
+from python_api_client.resource import BULK_NONE, BULK_RAISE, CHUNK_SIZE, request_scope
+from python_api_client.session import SessionPool, THREAD_SCOPE
+
+BASE_API_URL = conf.settings.BASE_API_URL
 
 
 PORT = 8001
@@ -37,10 +63,140 @@ class RelatedModel(Model):
         return '%stestmodels/{testmodel_pk}/%ss/' % (BASE_API_URL, cls.verbose_name())
 
 
+class PagedModel(Model):
+    _page_size = 2
+
+
+class BulkModel(Model):
+    _bulk_lookup = 'id__in'
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/' % BASE_API_URL
+
+
+class CachedModel(Model):
+    _cache_ttl = 60
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/' % BASE_API_URL
+
+
+class FieldsModel(Model):
+    _fields = ('id', 'name', 'description')
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/' % BASE_API_URL
+
+
+class ConvertedModel(Model):
+    _renamed_fields = {'description': 'summary'}
+    _date_fields = ('created',)
+
+    def _deserialize_name(self, value, data_dict):
+        return value.upper()
+
+    @staticmethod
+    def _deserialize_id(value, data_dict):
+        return int(value)
+
+
+class DefaultsModel(Model):
+    _fields = ('id', 'name', 'tags')
+
+    def __init__(self):
+        self.tags = []
+
+
+class LazyDateModel(Model):
+    _date_fields = ('created',)
+    _lazy_dates = True
+
+
+class LazyDateFieldsModel(Model):
+    _fields = ('id', 'created')
+    _date_fields = ('created',)
+    _lazy_dates = True
+
+
+class BatchModel(Model):
+    _batch_writes = True
+
+
+class LimitedModel(Model):
+    _rate_limit = {'rate': 1000, 'max_in_flight': 2}
+
+
 class SaveModel(Model):
     _can_save = True
 
 
+class ParentModel(Model):
+    _relations = {'children': Nested(lambda: ChildModel, 'testmodel_pk')}
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/' % BASE_API_URL
+
+
+class ExpandedParentModel(ParentModel):
+    _expand_param = 'expand'
+
+
+class ChildModel(Model):
+    _fields = ('id', 'testmodel_id', 'name')
+    _relations = {'parent': ForeignKey(ParentModel, 'testmodel_id')}
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/{testmodel_pk}/relatedmodels/' % BASE_API_URL
+
+
+class SnapshotModel(Model):
+    _fields = ('id', 'name', 'created')
+    _date_fields = ('created',)
+    _modified_since = 'modified__gte'
+
+    @classmethod
+    def url(cls):
+        return '%stestmodels/' % BASE_API_URL
+
+
+class FakePool(object):
+    """
+    Stands in for a SessionPool, returning (status_code, headers, body) from responses in turn,
+    exceptions in responses are raised
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(url, *response)
+
+
+class FakeResponse(object):
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        pass
+
+
 class ApiClientTestCase(unittest.TestCase):
     """
     This test is limited to GET requests at the moment
@@ -97,6 +253,55 @@ class ApiClientTestCase(unittest.TestCase):
                          'Object returned from get should be TestModel but was %s' % m.__class__.__name__)
         self.assertEqual(m.name, 'Test Model One', 'Object attribute was not set correctly.')
 
+    def test_declared_fields(self):
+        self.patcher.start()
+        m = FieldsModel.objects.get(pk=1)
+        self.assertFalse(hasattr(m, '__dict__'), 'Models with declared fields should not have a __dict__')
+        self.assertEqual(m.serialize(), {'id': 1, 'name': 'Test Model One', 'description': 'First of Test Model'},
+                         'Serialized fields are not correct: %s' % m.serialize())
+        self.assertEqual(m.serialize_changed(), {}, 'Nothing has changed yet: %s' % m.serialize_changed())
+        m.name = 'New Name'
+        self.assertEqual(m.serialize_changed(), {'name': 'New Name'},
+                         'Only the changed field should be serialized: %s' % m.serialize_changed())
+        self.assertRaises(AttributeError, setattr, m, 'undeclared', 1)
+
+        m = FieldsModel().deserialize({'id': 2, 'extra': 'ignored'})
+        self.assertEqual(m.serialize(), {'id': 2}, 'Undeclared and missing keys should be skipped: %s' % m.serialize())
+
+    def test_deserialize(self):
+        data = [{'id': 1, 'name': 'one', 'description': 'First', 'created': '2014-07-01T12:00:00Z'},
+                {'id': 2, 'name': 'two', 'description': 'Second', 'created': None}]
+        instances = ConvertedModel.deserialize_many(data)
+        m = instances[0]
+        self.assertEqual(m.name, 'ONE', '_deserialize_name should convert the name, got %s' % m.name)
+        self.assertEqual(m.summary, 'First', 'description should be renamed to summary')
+        self.assertFalse(hasattr(m, 'description'), 'Renamed keys should not be kept under the api name')
+        self.assertEqual(m.created.year, 2014, 'created should be parsed as a date, got %r' % m.created)
+        self.assertEqual(instances[1].created, None, 'Empty dates should not be parsed')
+        self.assertEqual(m.serialize()['description'], 'First', 'serialize should use the api key for renamed fields')
+        self.assertEqual(ConvertedModel().deserialize({'id': '3'}).id, 3, 'staticmethod converters should be called')
+
+        m = DefaultsModel.deserialize_many([{'id': 1, 'name': 'one'}])[0]
+        self.assertEqual(m.tags, [], 'Defaults set in __init__ should be kept')
+        self.assertEqual(m.serialize_changed(), {}, 'Defaults set in __init__ should not be dirty')
+
+    def test_dates(self):
+        tz = pytz.timezone('Europe/London')
+        expected = tz.localize(datetime.datetime(2014, 7, 1, 13, 0, 0, 500000))
+        for value in ('2014-07-01T12:00:00.5Z', '2014-07-01T14:00:00.500+02:00', '2014-07-01 13:00:00.5',
+                      'Tue, 01 Jul 2014 12:00:00.5 GMT'):
+            parsed = parse_datetime(value, tz)
+            self.assertEqual(parsed, expected, '%s was parsed as %s' % (value, parsed))
+            self.assertEqual(parsed.utcoffset(), datetime.timedelta(hours=1),
+                             '%s should be converted to the time zone, got %s' % (value, parsed.utcoffset()))
+        self.assertEqual(parse_datetime('2014-07-01'), datetime.datetime(2014, 7, 1), 'Date only strings should parse')
+
+        for model in (LazyDateModel, LazyDateFieldsModel):
+            m = model().deserialize({'id': 1, 'created': '2014-07-01T12:00:00Z'})
+            self.assertEqual(m.created, expected.replace(microsecond=0), '%s created was not parsed' % model.__name__)
+            self.assertEqual(m.created.utcoffset(), datetime.timedelta(hours=1), '%s created has the wrong tz' % model.__name__)
+        self.assertEqual(m.serialize_changed(), {}, 'Parsing a lazy date should not mark it as changed')
+
     def test_resource_set(self):
         self.patcher.start()
         rs = TestModel.objects.all()
@@ -119,6 +324,665 @@ class ApiClientTestCase(unittest.TestCase):
         self.assertEqual(m.pk, 2, 'Should return second object in list (pk=2), pk was %s' % m.pk)
         """
 
+    def test_pagination(self):
+        self.patcher.start()
+        rs = PagedModel.objects.all()
+        names = [m.name for m in rs]
+        self.assertEqual(names, ['Paged Model One', 'Paged Model Two', 'Paged Model Three'],
+                         'ResourceSet should follow meta.next across pages, got %s' % names)
+        self.assertEqual(rs.meta.offset, 2, 'Meta should be from the last page, offset was %s' % rs.meta.offset)
+
+        rs = PagedModel.objects.all()
+        page_params = rs._page_params(rs.params, 0)
+        self.assertEqual(page_params, {'limit_start': 0, 'limit_stop': 2},
+                         'First page should request limit_start=0&limit_stop=2, got %s' % page_params)
+        rs.set_limits(1, 2)
+        page_params = rs._page_params(rs.params, 1)
+        self.assertEqual(page_params, {'limit_start': 1, 'limit_stop': 2},
+                         'Page should not go past the slice, got %s' % page_params)
+
+        page = json.dumps({'objects': [{'id': i} for i in range(1, 11)], 'meta': {'next': '?limit_start=10'}})
+        rs = PagedModel.objects.all()
+        rs._pool = FakePool(*[(200, {}, page)] * 10)
+        self.assertEqual([m.id for m in rs[:3]], [1, 2, 3], 'Rows past the slice should not be returned')
+        rs[1]
+        self.assertEqual(len(rs._pool.requests), 2, 'Slices should not follow meta.next past their end')
+
+        rs = PagedModel.objects.all()
+        rs._pool = FakePool(*[(200, {}, '[{"id": 1}, {"id": 2}]')] * 5)
+        self.assertEqual([m.id for m in rs], [1, 2], 'A list api that ignores the window should not repeat rows')
+        self.assertEqual(len(rs._pool.requests), 2)
+
+        threads = []
+        pool = FakePool(*[(200, {}, json.dumps({'objects': [{'id': i}, {'id': i + 1}],
+                                                'meta': {'offset': i, 'next': '?limit_start=%s' % (i + 2) if i < 6 else None}}))
+                          for i in (0, 2, 4, 6)])
+        request = pool.request
+        pool.request = lambda *args, **kwargs: threads.append(threading.current_thread()) or request(*args, **kwargs)
+        rs = PagedModel.objects.all()
+        rs._pool = pool
+        offsets = []
+        for page in rs._pages():
+            time.sleep(0.05)
+            offsets.append(rs.meta.offset)
+        self.assertEqual(offsets, [0, 2, 4, 6], 'meta should be the page being used, got %s' % offsets)
+        self.assertEqual(len(set(threads[1:])), 1, 'One worker should prefetch every page, used %s' % len(set(threads)))
+
+    def test_async(self):
+        self.patcher.start()
+        results = [TestModel.objects.aget(pk=pk) for pk in (1, 2, 3)]
+        names = [m.name for m in gather(results, timeout=10)]
+        self.assertEqual(names, ['Test Model One', 'Test Model Two', 'Test Model Three'],
+                         'aget should return the instances in order, got %s' % names)
+
+        rs = TestModel.objects.aall()
+        self.assertEqual(rs.__class__.__name__, 'AsyncResourceSet',
+                         'Object returned from aall should be AsyncResourceSet but was %s' % rs.__class__.__name__)
+        objects = rs.afetch().get(10)
+        self.assertEqual(len(objects), 3, 'afetch should return 3 objects, got %s' % len(objects))
+        pages = list(rs.pages())
+        self.assertEqual([len(page) for page in pages], [3], 'pages should yield one page of 3, got %s' % pages)
+
+        self.assertRaises(NotFoundException, TestModel.objects.aget(pk=10).get, 10)
+
+        old_pool = aio.get_worker_pool()
+        aio.configure(workers=2)
+        try:
+            pool = aio.get_worker_pool()
+            self.assertFalse(pool is old_pool, 'configure should replace the worker pool')
+            self.assertEqual(len(pool._pool), 2, 'the worker pool should have 2 threads, got %s' % len(pool._pool))
+            self.assertEqual(TestModel.objects.aget(pk=1).get(10).name, 'Test Model One')
+        finally:
+            aio.configure()
+
+    def test_in_bulk(self):
+        self.patcher.start()
+        instances = TestModel.objects.in_bulk([3, 1, 3, 10, 2], max_workers=4)
+        self.assertEqual(list(instances.keys()), [3, 1, 2],
+                         'in_bulk should dedupe, keep order and skip missing pks, got %s' % list(instances.keys()))
+        self.assertEqual(instances[1].name, 'Test Model One', 'in_bulk returned the wrong instance for pk 1')
+
+        instances = TestModel.objects.in_bulk([1, 10], on_error=BULK_NONE)
+        self.assertEqual(instances[10], None, 'in_bulk should map failed pks to None, got %s' % instances[10])
+        self.assertRaises(NotFoundException, TestModel.objects.in_bulk, [1, 10], on_error=BULK_RAISE)
+
+        instances = BulkModel.objects.in_bulk([2, 1, 5])
+        self.assertEqual(list(instances.keys()), [2, 1],
+                         'in_bulk with a bulk lookup should skip pks not in the response, got %s' % list(instances.keys()))
+
+        self.patcher.stop()
+        rs = TestModel.objects.get_resource()
+        rs._pool = FakePool((200, {}, '{"id": 1}'), requests.Timeout('Read timed out'))
+        rs._retry_policy = RetryPolicy(max_retries=0)
+        rs._circuit_breakers = CircuitBreakers()
+        instances = rs.in_bulk([1, 2], max_workers=1, on_error=BULK_NONE)
+        self.assertEqual((instances[1].id, instances[2]), (1, None), 'A timeout should only fail its pk, got %s' % instances)
+
+    def test_cache(self):
+        self.patcher.start()
+        cache = MemoryCache()
+        rs = CachedModel.objects.get_resource()
+        rs._cache = cache
+        url = rs.build_url(lookup=1)
+        response = rs.send('get', url)
+        self.assertFalse(getattr(response, 'from_cache', False), 'First request should not come from the cache')
+        response = rs.send('get', url)
+        self.assertTrue(response.from_cache, 'Second request should come from the cache')
+        self.assertEqual(response.json()['name'], 'Test Model One', 'Cached response has the wrong content')
+        self.assertFalse(getattr(rs.send('get', url, token='abc'), 'from_cache', False),
+                         'Requests with a different token should not share cache entries')
+
+        cache.invalidate(rs.url)
+        self.assertEqual(len(cache), 0, 'Invalidating the resource url should remove its entries')
+
+        cache = MemoryCache(max_entries=2, max_bytes=100)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, CacheEntry(key, 200, {}, '{}', 60))
+        self.assertEqual(cache.get('a'), None, 'Least recently used entry should be evicted')
+        cache.set('d', CacheEntry('d', 200, {}, 'x' * 99, 60))
+        self.assertEqual(len(cache), 1, 'Entries should be evicted to stay under max_bytes, %s left' % len(cache))
+        cache.set('e', CacheEntry('e', 200, {'etag': '"1"'}, '{}', -1))
+        self.assertEqual(cache.get('e').revalidation_headers(), {'If-None-Match': '"1"'},
+                         'Stale entries with an etag should be kept for revalidation')
+
+    def test_sqlite_cache(self):
+        self.patcher.start()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'cache.sqlite')
+
+        rs = CachedModel.objects.get_resource()
+        rs._cache = SqliteCache(path)
+        url = rs.build_url(lookup=1)
+        rs.send('get', url)
+
+        # a second cache on the same file stands in for another process
+        rs = CachedModel.objects.get_resource()
+        rs._cache = SqliteCache(path)
+        response = rs.send('get', url)
+        self.assertTrue(getattr(response, 'from_cache', False), 'Response should come from the shared cache')
+        self.assertEqual(response.json()['name'], 'Test Model One', 'Cached response has the wrong content')
+
+        cache = SqliteCache(path, max_entries=2)
+        cache.clear()
+        for key in ('a', 'b', 'c'):
+            cache.set(key, CacheEntry(key, 200, {}, '{}', 60))
+        self.assertEqual(len(cache), 2, 'Cache should evict down to max_entries, has %s' % len(cache))
+        self.assertEqual(cache.get('a'), None, 'Least recently used entry should be evicted')
+        cache.invalidate('b')
+        self.assertEqual(cache.get('b'), None, 'Invalidated entry should be removed')
+
+    def test_single_flight(self):
+        self.patcher.start()
+        group = SingleFlight()
+        release = threading.Event()
+        url = '%stestmodels/1/' % BASE_API_URL
+
+        def request():
+            release.wait(5)
+            return TestModel.objects.get_resource()._request('get', url + 'response.json')
+
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(group.do(url, request))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        while group.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(group.get_stats(), {'requests': 1, 'coalesced': 4, 'in_flight': 0},
+                         'Identical calls should share one request, got %s' % group.get_stats())
+        instances = [TestModel().deserialize(response.json()) for response in responses]
+        self.assertEqual(set(m.name for m in instances), set(['Test Model One']), 'Coalesced responses differ')
+        self.assertEqual(len(set(id(response) for response in responses)), 5, 'Each caller should get its own response')
+
+    def test_stream(self):
+        self.patcher.start()
+        names = [m.name for m in PagedModel.objects.all().iterator(stream=True)]
+        self.assertEqual(names, ['Paged Model One', 'Paged Model Two', 'Paged Model Three'],
+                         'Streamed ResourceSet should follow meta.next across pages, got %s' % names)
+        rs = TestModel.objects.all()
+        self.assertEqual(len(list(rs.iterator(stream=True))), 3, 'Streamed list response should yield 3 objects')
+
+        body = u'{"objects": [{"id": 1, "name": "\u00e9t\u00e9"}, {"id": 22, "n": 1.5e3}], "meta": {"total_count": 2}}'
+        body = body.encode('utf-8')
+        for chunk_size in (1, 7, 1024):
+            keys = []
+            stream = iter_json_list(body, chunk_size, on_key=lambda key, value: keys.append(key))
+            items = list(stream)
+            self.assertEqual(items, [{'id': 1, 'name': u'\u00e9t\u00e9'}, {'id': 22, 'n': 1500.0}],
+                             'Stream with chunk size %s parsed %s' % (chunk_size, items))
+            self.assertEqual((keys, stream.extra['meta'], len(stream)), (['meta'], {'total_count': 2}, 2),
+                             'Meta was not read from the stream')
+
+        def on_error(payload):
+            raise ApiException(payload)
+
+        stream = iter_json_list(b'{"error": "Broken", "traceback": "line 1", "objects": []}', 5, on_error=on_error)
+        try:
+            list(stream)
+            self.fail('Error payload should raise')
+        except ApiException as e:
+            self.assertEqual(e.args[0], {'error': 'Broken', 'traceback': 'line 1', 'objects': []},
+                             'on_error should get the whole error payload, got %s' % e.args[0])
+        self.assertRaises(ApiException, list, iter_json_list(b'[{"id": 1}, nope]', 4, on_error=on_error))
+
+    def test_codec(self):
+        self.patcher.start()
+        self.assertRaises(ValueError, codec.set_codec, 'nojson')
+        self.assertEqual(codec.get_codec().name, 'json', 'Unknown backends should not replace the codec')
+        self.assertEqual(codec.loads(codec.dumps({'a': [1, 2]})), {'a': [1, 2]}, 'Codec should round trip')
+
+        rs = TestModel.objects.get_resource()
+        response = rs.send('get', rs.build_url(lookup=1))
+        self.assertEqual(codec.decode_response(response)['name'], 'Test Model One', 'Response was not decoded')
+        self.assertTrue(codec.decode_response(response) is codec.decode_response(response),
+                        'A response should only be decoded once')
+
+    def test_bulk_write(self):
+        sent = []
+
+        def send(rs, method, url, **kwargs):
+            sent.append((method, url, kwargs.get('data')))
+            if url.endswith('/2/'):
+                raise NotFoundException('Resource not found.')
+            return Mock(status_code={'post': 201, 'patch': 202, 'delete': 204}[method])
+
+        instances = [TestModel().deserialize({'id': pk, 'name': 'Name %s' % pk}) for pk in (1, 2, 3)]
+        instances[0].name = 'Changed'
+        instances[1].name = 'Changed'
+        with patch('python_api_client.resource.ResourceSet.send', send):
+            report = TestModel.objects.bulk_update(instances, fields=['name'], max_workers=2)
+            self.assertEqual(report.succeeded, [instances[0]], 'Only pk 1 should be updated, got %s' % report)
+            self.assertEqual(report.skipped, [instances[2]], 'Unchanged pk 3 should be skipped, got %s' % report)
+            self.assertTrue(isinstance(report.failed[0][1], NotFoundException), 'pk 2 should fail, got %s' % report)
+            self.assertEqual(sorted(r[2] for r in sent), ['{"name": "Changed"}'] * 2,
+                             'Only changed fields should be sent, got %s' % sent)
+
+            report = TestModel.objects.bulk_delete([1, instances[1], 3])
+            self.assertEqual(len(report.succeeded), 2, 'Deleting pks 1 and 3 should succeed, got %s' % report)
+
+            del sent[:]
+            new_instances = [BatchModel() for i in range(CHUNK_SIZE + 1)]
+            for instance in new_instances:
+                instance.name = 'New'
+            report = BatchModel.objects.bulk_create(new_instances)
+            self.assertEqual(len(report.succeeded), CHUNK_SIZE + 1, 'Batch create failed, got %s' % report)
+            self.assertEqual([r[0] for r in sent], ['patch', 'patch'],
+                             'Batch writes should send one request per chunk, got %s' % [r[0] for r in sent])
+
+        rs = TestModel.objects.get_resource()
+        rs._pool = FakePool((201, {}, '{}'), requests.ConnectionError('Connection reset'), (201, {}, '{}'))
+        rs._circuit_breakers = CircuitBreakers()
+        new_instances = [TestModel() for i in range(3)]
+        for instance in new_instances:
+            instance.name = 'New'
+        report = rs.bulk_create(new_instances, max_workers=1)
+        self.assertEqual(report.succeeded, [new_instances[0], new_instances[2]], 'Got %s' % report)
+        self.assertTrue(isinstance(report.failed[0][1], requests.ConnectionError),
+                        'A connection error should fail only its item, got %s' % report.failed)
+
+    def test_retries(self):
+        url = '%stestmodels/1/' % BASE_API_URL
+        ok = (200, {}, '{"id": 1}')
+        busy = (503, {'retry-after': '0'}, '{"error": "Busy"}')
+        limited = (429, {'retry-after': '0'}, '{"error": "Slow down"}')
+
+        pool = FakePool(busy, limited, ok)
+        rs = TestModel.objects.get_resource()
+        rs._pool = pool
+        rs._retry_policy = RetryPolicy(max_retries=2, timeout=5)
+        rs._circuit_breakers = CircuitBreakers()
+        self.assertEqual(rs.get(pk=1).id, 1, 'get should succeed after retrying')
+        self.assertEqual(len(pool.requests), 3, 'get should be retried twice, sent %s' % len(pool.requests))
+        self.assertEqual(pool.requests[0][2]['timeout'], 5, 'Each attempt should use the policy timeout')
+
+        pool.responses = [limited, limited, limited]
+        self.assertRaises(RateLimitedException, rs.get, pk=1)
+
+        pool.responses = [busy, ok]
+        del pool.requests[:]
+        self.assertRaises(ApiException, rs.send, 'post', url, data={})
+        self.assertEqual(len(pool.requests), 1, 'post should not be retried, sent %s' % len(pool.requests))
+
+        rs._retry_policy = RetryPolicy(max_retries=0)
+        rs._circuit_breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+        pool.responses = [busy, busy, ok]
+        self.assertRaises(ApiException, rs.get, pk=1)
+        self.assertRaises(ApiException, rs.get, pk=1)
+        self.assertRaises(CircuitOpenException, rs.get, pk=1)
+        self.assertEqual(len(pool.responses), 1, 'An open circuit should not send requests')
+
+        breaker = rs.circuit_breakers.get(url)
+        breaker.opened_at -= 120
+        rs._pool = Mock(request=Mock(side_effect=ValueError('Too many redirects')))
+        self.assertRaises(ValueError, rs.get, pk=1)
+        self.assertNotEqual(breaker.state, HALF_OPEN, 'A trial request that raised should not leave the circuit half open')
+        self.assertEqual(breaker.failures, 2, 'A client side error should not count as a failure of the host')
+        rs._pool = pool
+        self.assertEqual(rs.get(pk=1).id, 1, 'The next request should be let through as the trial')
+
+        rs._circuit_breakers = CircuitBreakers(failure_threshold=2, reset_timeout=60)
+        rs._pool = Mock(request=Mock(side_effect=ValueError('Invalid url')))
+        for i in range(3):
+            self.assertRaises(ValueError, rs.get, pk=1)
+        self.assertEqual(rs.circuit_breakers.get(url).state, CLOSED, 'Client side errors should not open the circuit')
+
+    def test_rate_limits(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        waits = [bucket.take() for i in range(4)]
+        self.assertEqual(waits[:2], [0, 0], 'The burst should not wait, got %s' % waits)
+        self.assertTrue(0.05 < waits[2] < waits[3] <= 0.2, 'Requests past the burst should wait, got %s' % waits)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'bucket')
+        FileTokenBucket(path, rate=1, burst=1).take()
+        self.assertTrue(FileTokenBucket(path, rate=1, burst=1).take() > 0.5,
+                        'File buckets on the same path should share one budget')
+
+        limits = Limits()
+        limiter = limits.limit(BASE_API_URL, rate=1000, max_in_flight=1)
+        test_limiter = limits.limit('%stestmodels/' % BASE_API_URL, rate=1000)
+        model_limiter = limits.limit_model(RelatedModel, rate=1000)
+        self.assertTrue(limits.get('%sothermodels/1/' % BASE_API_URL) is limiter, 'Base url limiter should match')
+        self.assertTrue(limits.get('%stestmodels/1/' % BASE_API_URL, TestModel) is test_limiter,
+                        'The longest matching prefix should win')
+        self.assertTrue(limits.get('%stestmodels/1/relatedmodels/' % BASE_API_URL, RelatedModel) is model_limiter,
+                        'A model limiter should be used for its model')
+        self.assertEqual(limits.get('http://example.com/'), None, 'Other hosts should not be limited')
+
+        rs = PagedModel.objects.get_resource()
+        rs._pool = FakePool((200, {}, '{"id": 1}'))
+        rs._limits = limits
+        rs.get(pk=1)
+        self.assertEqual(limiter.get_stats()['requests'], 1, 'Requests should go through the limiter')
+        self.assertEqual(limiter.get_stats()['in_flight'], 0, 'Finished requests should leave the limiter')
+
+        with limiter.acquire():
+            thread = threading.Thread(target=lambda: limiter.acquire().__enter__())
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive(), 'max_in_flight should block a second request')
+        thread.join()
+
+        class NestedLimitedModel(Model):
+            _rate_limit = {'rate': 1000}
+
+            @classmethod
+            def url(cls):
+                return '%stestmodels/{testmodel_pk}/nestedlimitedmodels/' % BASE_API_URL
+
+        class OtherLimitedModel(NestedLimitedModel):
+            pass
+
+        tenant = Client(base_url='http://tenant.example.com/api/', limits=Limits(),
+                        pool=FakePool((200, {}, '{"id": 1}')))
+        rs = NestedLimitedModel.objects.using(tenant).filter(testmodel_pk=1)
+        rs.get(pk=1)
+        nested_limiter = tenant.limits.model_limiter(NestedLimitedModel)
+        self.assertEqual(nested_limiter.get_stats()['requests'], 1, 'Declared _rate_limit should limit the model')
+        self.assertEqual(tenant.limits.get('http://tenant.example.com/api/testmodels/1/', TestModel), None,
+                         'A nested model limiter should not limit its parent url')
+        self.assertFalse(tenant.limits.model_limiter(OtherLimitedModel) is nested_limiter,
+                         'Models on the same url should not share a limiter')
+        self.assertEqual(LimitedModel.objects.get_resource().limits.get(LimitedModel.url()), None,
+                         'Model limiters should not be registered by url')
+
+    def test_instrumentation(self):
+        inst = get_instrumentation()
+        self.assertFalse(inst.enabled, 'Instrumentation should be off until something is added')
+        registry = inst.add_sink(MetricsRegistry())
+        calls = []
+        spans = []
+        inst.add_pre_request(lambda rs, method, url, kwargs: calls.append(('pre', method)))
+        inst.add_post_request(lambda rs, method, url, response, elapsed, error: calls.append(('post', error)))
+        inst.set_tracer(lambda name, attributes: spans.append(name) or null_span())
+        self.addCleanup(inst.clear)
+
+        rs = SaveModel.objects.get_resource()
+        rs._pool = FakePool((503, {}, '{}'), (200, {}, '{"id": 1}'))
+        rs._retry_policy = RetryPolicy(backoff=0.001)
+        rs.get(pk=1)
+        self.assertEqual(calls, [('pre', 'get'), ('post', None)], 'Hooks should wrap each request')
+        self.assertEqual(spans, ['api.request'], 'Each request should be traced')
+        labels = {'model': 'SaveModel', 'method': 'get'}
+        self.assertEqual(registry.get_counter('api_requests_total', status=200, **labels), 1)
+        self.assertEqual(registry.get_counter('api_retries_total', **labels), 1)
+        self.assertEqual(registry.get_histogram('api_request_seconds', **labels).count, 1)
+        self.assertEqual(registry.get_histogram('api_response_bytes', **labels).sum, len('{"id": 1}'))
+        self.assertEqual(registry.get_histogram('api_deserialize_seconds', model='SaveModel').count, 1)
+        text = registry.to_prometheus()
+        self.assertTrue('# TYPE api_request_seconds histogram' in text, text)
+        self.assertTrue('api_requests_total{method="get",model="SaveModel",status="200"} 1' in text, text)
+
+        inst.clear()
+        self.assertFalse(inst.enabled, 'Clearing should switch instrumentation off')
+
+    def test_prefetch_related(self):
+        self.patcher.start()
+        parents = list(ParentModel.objects.all().prefetch_related('children'))
+        self.assertEqual([[child.id for child in parent.children] for parent in parents], [[11], [21, 22], []])
+        self.assertEqual(parents[1].children[0].name, 'Related Model Two')
+        self.assertFalse('children' in parents[0].serialize(), 'Relations should not be serialized')
+
+        children = list(ChildModel.objects.filter(testmodel_pk=2).prefetch_related('parent'))
+        self.assertEqual([child.parent.name for child in children], ['Test Model Two', 'Test Model Two'])
+        self.assertRaises(ResourceSetException, ChildModel.objects.prefetch_related, 'children')
+
+        rs = ExpandedParentModel.objects.all().prefetch_related('children')
+        rs._pool = FakePool((200, {}, '[{"id": 1, "children": [{"id": 11, "testmodel_id": 1}]}]'))
+        parents = list(rs)
+        self.assertEqual(rs._pool.requests[0][2]['params']['expand'], 'children')
+        self.assertEqual(len(rs._pool.requests), 1, 'Embedded relations should not be fetched again')
+        self.assertTrue(isinstance(parents[0].children[0], ChildModel))
+
+    def test_only_and_defer(self):
+        rs = FieldsModel.objects.all().only('name')
+        rs._pool = FakePool((200, {}, '[{"id": 1, "name": "One", "description": "Not wanted"}]'),
+                            (200, {}, '{"id": 1, "name": "Changed", "description": "First"}'))
+        instance = list(rs)[0]
+        self.assertEqual(rs._pool.requests[0][2]['params']['fields'], 'id,name')
+        self.assertEqual(instance.serialize(), {'id': 1, 'name': 'One'}, 'Only the requested fields should be loaded')
+
+        instance.name = 'Two'
+        self.assertEqual(instance.description, 'First', 'Deferred fields should be fetched when read')
+        self.assertEqual(len(rs._pool.requests), 2, 'Deferred fields should be fetched once')
+        self.assertEqual(rs._pool.requests[1][2]['params']['fields'], 'description,id')
+        self.assertEqual(instance.name, 'Two', 'Loading deferred fields should keep changes')
+        self.assertEqual(instance.serialize_changed(), {'name': 'Two'})
+
+        self.patcher.start()
+        instance = list(TestModel.objects.all().defer('description'))[0]
+        self.assertFalse('description' in instance.serialize(), 'Deferred fields should not be deserialized')
+        self.assertEqual(instance.description, 'First of Test Model')
+        self.assertFalse('description' in instance.serialize_changed(), 'Loaded deferred fields should not be changed')
+
+        rs = TestModel.objects.all().only('name')
+        rs._pool = FakePool((200, {}, '[{"id": 1, "name": "One"}]'))
+        instance = list(rs)[0]
+        self.assertEqual(getattr(instance, 'missing', None), None, 'Unknown names should not fetch deferred fields')
+        self.assertEqual(len(rs._pool.requests), 1)
+
+        rs = ChildModel.objects.filter(testmodel_pk=1).only('testmodel_id').using(Client(token='abc'))
+        rs._pool = FakePool((200, {}, '[{"id": 2, "testmodel_id": 1}]'), (200, {}, '{"id": 2, "name": "Loaded"}'))
+        instance = list(rs)[0]
+        self.assertEqual(instance.name, 'Loaded')
+        method, url, kwargs = rs._pool.requests[1]
+        self.assertEqual((url, kwargs['headers']['AUTHORIZATION']),
+                         ('%stestmodels/1/relatedmodels/2/response.json' % BASE_API_URL, 'JWT abc'),
+                         'Deferred fields should load through the filters and client of the set')
+
+    def test_chaining(self):
+        base = RelatedModel.objects.filter(testmodel_pk=1)
+        first = base.filter(name='one')
+        second = base.filter(name='two')
+        self.assertEqual(base._filters, {'testmodel_pk': 1}, 'filter() should not change the set it was called on')
+        self.assertEqual(second._filters, {'testmodel_pk': 1, 'name': 'two'})
+        self.assertNotEqual(first.request_key(), second.request_key())
+        self.assertEqual(base.filter(b=1, a=2).request_key(), base.filter(a=2).filter(b=1).request_key(),
+                         'Equivalent sets should have the same request key')
+
+        sliced = TestModel.objects.all()[1:3][1:5]
+        self.assertEqual((sliced._limit_start, sliced._limit_stop), (2, 3), 'Slices of slices should combine')
+
+        rs = TestModel.objects.all()
+        rs._pool = FakePool((200, {}, '[{"id": 1}, {"id": 2}, {"id": 3}]'))
+        self.assertEqual(len(rs), 3)
+        self.assertEqual([instance.id for instance in rs[1:]], [2, 3])
+        self.assertEqual(len(rs._pool.requests), 1, 'Slicing an evaluated set should not make a request')
+
+        pool = FakePool((200, {}, '[{"id": 1}]'))
+        with request_scope():
+            first = TestModel.objects.filter(a=1)
+            first._pool = pool
+            second = TestModel.objects.filter(a=1)
+            second._pool = pool
+            self.assertEqual(list(first), list(second))
+        self.assertEqual(len(pool.requests), 1, 'Equivalent sets should share results in a request scope')
+
+    def test_count(self):
+        rs = PagedModel.objects.all()[1:]
+        rs._pool = FakePool((200, {}, '{"objects": [{"id": 2}], "meta": {"total_count": 40}}'))
+        self.assertEqual((rs.count(), len(rs), rs.exists()), (39, 39, True))
+        self.assertEqual(len(rs._pool.requests), 1, 'count and exists should be cached on the set')
+        self.assertEqual(rs._pool.requests[0][2]['params'], {'limit_start': 1, 'limit_stop': 2},
+                         'count should only ask for one result')
+        self.assertEqual(rs.meta.total_count, 40)
+
+        rs = PagedModel.objects.filter(name='none')
+        rs._pool = FakePool((200, {}, '{"objects": [], "meta": {}}'))
+        self.assertFalse(rs.exists())
+        self.assertEqual(rs.count(), 0)
+
+        rs = PagedModel.objects.all()[3:3]
+        rs._pool = FakePool()
+        self.assertEqual((rs.exists(), rs.count()), (False, 0), 'An empty slice should have no results')
+        self.assertEqual(rs._pool.requests, [], 'An empty slice should not make a request')
+
+        rs = PagedModel.objects.all()
+        rs._pool = FakePool((200, {}, '{"objects": [{"id": 1}], "meta": {}}'),
+                            (200, {}, '{"objects": [{"id": 1}, {"id": 2}], "meta": {}}'),
+                            (200, {}, '{"objects": [], "meta": {}}'))
+        self.assertEqual(rs.count(), 2, 'Without total_count the results should be counted')
+        self.assertEqual([instance.id for instance in rs], [1, 2])
+
+        rs = PagedModel.objects.all()
+        rs._pool = FakePool((200, {}, '[{"id": 1}]'), (200, {}, '[{"id": 1}]'))
+        self.assertEqual((rs.meta, rs.meta), (None, None))
+        self.assertEqual(len(rs._pool.requests), 1, 'A set should only be probed for meta once')
+        rs = PagedModel.objects.all()
+        rs._pool = FakePool((200, {}, '[{"id": 1}]'), (200, {}, '[{"id": 1}]'))
+        list(rs)
+        self.assertEqual((rs.meta, rs.meta), (None, None))
+        self.assertEqual(len(rs._pool.requests), 1, 'An evaluated set should not be probed for meta')
+
+    def test_dirty_tracking(self):
+        m = TestModel().deserialize({'id': 1, 'name': 'One', 'count': 0, 'tags': ['a'], 'extra': {'nested': {'x': 1}}})
+        self.assertEqual(m.serialize_changed(), {})
+        self.assertFalse('_initial_data' in m.serialize(), 'serialize should leave out internal attributes')
+        m.count = 0
+        m.name = 'Two'
+        self.assertEqual(m.serialize_changed(), {'name': 'Two'}, 'Only changed values should be sent')
+        m.count = 5
+        self.assertEqual(m.serialize_changed(), {'name': 'Two', 'count': 5}, 'Falsy initial values can change')
+
+        m.extra['nested']['x'] = 2
+        m.tags.append('b')
+        changed = m.serialize_changed()
+        self.assertEqual((changed['extra'], changed['tags']), ({'nested': {'x': 2}}, ['a', 'b']))
+        self.assertEqual(m._initial_data['extra'], {'nested': {'x': 1}}, 'Nested changes should not touch the loaded data')
+        self.assertEqual(json.loads(codec.dumps(changed))['tags'], ['a', 'b'])
+
+        m = FieldsModel().deserialize({'id': 1, 'name': 'One', 'description': ['a']})
+        m.description.append('b')
+        self.assertEqual(m.serialize_changed(), {'description': ['a', 'b']})
+        m.description.pop()
+        self.assertEqual(m.serialize_changed(), {}, 'Values changed back should not be sent')
+
+        rs = FieldsModel.objects.get_resource()
+        rs._pool = FakePool((202, {}, '{}'), (202, {}, '{}'))
+        m = FieldsModel().deserialize({'id': 1, 'name': 'One', 'description': ['a']})
+        m.name = 'Two'
+        rs.patch(m)
+        m.description.append('b')
+        rs.patch(m)
+        self.assertEqual(json.loads(rs._pool.requests[1][2]['data']), {'description': ['a', 'b']},
+                         'Fields sent by an earlier patch should not be sent again')
+        m.description.append('c')
+        self.assertEqual(m.serialize_changed(), {'description': ['a', 'b', 'c']})
+
+        rs = TestModel.objects.get_resource()
+        rs._pool = FakePool((202, {}, '{}'))
+        m = TestModel().deserialize({'id': 1, 'name': 'One', 'tags': ['a']})
+        m.tags.append('b')
+        rs.patch(m)
+        self.assertEqual(m.serialize_changed(), {})
+        m.tags.append('c')
+        self.assertEqual(m.serialize_changed(), {'tags': ['a', 'b', 'c']})
+
+        for model in (TestModel, FieldsModel):
+            m = model().deserialize({'id': 1, 'name': {'tags': {'a': 1}}, 'description': [{'x': 1}]})
+            m.name.setdefault('tags', {})['b'] = 2
+            self.assertEqual(m.serialize_changed(), {'name': {'tags': {'a': 1, 'b': 2}}},
+                             'Changes through setdefault should be sent for %s' % model.__name__)
+            m = model().deserialize({'id': 1, 'name': {'tags': {'a': 1}}, 'description': [{'x': 1}]})
+            m.name.copy()['tags']['a'] = 2
+            m.description.pop()['x'] = 2
+            self.assertEqual(m.serialize_changed(), {'description': []})
+            self.assertEqual(m.name, {'tags': {'a': 1}}, 'Changing a copy should not change the field')
+            m.mark_saved()
+            m.name = {'x': 1}
+            m.mark_saved()
+            m.name['y'] = 2
+            self.assertEqual(m.serialize_changed(), {'name': {'x': 1, 'y': 2}},
+                             'Values set after loading should be tracked for %s' % model.__name__)
+
+        class UntrackedModel(Model):
+            _track_nested = False
+        m = UntrackedModel().deserialize({'id': 1, 'tags': ['a']})
+        m.tags.append('b')
+        m.mark_dirty('tags')
+        self.assertEqual(m.serialize_changed(), {'tags': ['a', 'b']})
+
+    def test_snapshot(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'testmodels.snapshot')
+        rs = SnapshotModel.objects.all()
+        rs._pool = FakePool((200, {}, '{"objects": [{"id": 1, "name": "One", "created": "2014-07-01T12:00:00Z"}, '
+                                      '{"id": 2, "name": "Two"}], "meta": {"total_count": 2}}'))
+        rs.dump(path)
+
+        loaded = SnapshotModel.objects.all().load(path)
+        self.assertEqual(loaded._result_cache._instances, [None, None], 'Rows should not be deserialized on load')
+        self.assertEqual((len(loaded), loaded.meta.total_count), (2, 2))
+        self.assertEqual(loaded[0].created, datetime.datetime(2014, 7, 1, 13, tzinfo=loaded[0].created.tzinfo))
+        self.assertEqual(loaded._result_cache._instances[1], None, 'Only used rows should be deserialized')
+        self.assertEqual([m.name for m in loaded], ['One', 'Two'])
+        self.assertRaises(ResourceSetException, SnapshotModel.objects.filter(name='One').load, path)
+
+        refreshing = SnapshotModel.objects.all()
+        refreshing._pool = FakePool((200, {}, '{"objects": [{"id": 2, "name": "Changed"}, {"id": 3, "name": "New"}], '
+                                              '"meta": {"total_count": 2}}'))
+        refreshed = refreshing.refresh(path)
+        self.assertTrue('modified__gte' in refreshing._pool.requests[0][2]['params'], 'Refresh should filter by time')
+        self.assertEqual([m.name for m in refreshed], ['One', 'Changed', 'New'])
+        self.assertEqual(refreshed.meta.total_count, 3)
+
+    def test_settings(self):
+        output = subprocess.check_output([sys.executable, '-c', 'import sys, python_api_client.models; '
+                                          'print(sorted(m for m in ("requests", "pytz", "dateutil") if m in sys.modules))'],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.strip(), '[]', 'Importing the models should not import %s' % output.strip())
+
+        class OtherApiModel(Model):
+            _settings = conf.Settings(conf.settings, BASE_API_URL='http://other.example.com/api/', TIME_ZONE='UTC')
+        self.assertEqual(OtherApiModel.url(), 'http://other.example.com/api/otherapimodels/')
+        self.assertEqual(TestModel.objects.get_resource().url, '%stestmodels/' % BASE_API_URL)
+        self.assertEqual(OtherApiModel().deserialize_date('2014-07-01T12:00:00Z').hour, 12)
+        self.assertEqual(Model().deserialize_date('2014-07-01T12:00:00Z').hour, 13)
+
+        london = pytz.timezone('Europe/London')
+        self.assertEqual(models.bst, london)
+        self.assertEqual(models.bst.localize(datetime.datetime(2014, 7, 1, 12)).utcoffset(), datetime.timedelta(hours=1))
+        self.assertEqual(datetime.datetime(2014, 1, 1, 12, tzinfo=models.bst).utcoffset(), datetime.timedelta(0))
+        now = datetime.datetime.now(models.bst)
+        self.assertEqual(now.tzinfo.zone, 'Europe/London', 'now(bst) should use the settings timezone')
+
+        self.addCleanup(conf.configure, BASE_API_URL=BASE_API_URL)
+        conf.configure(BASE_API_URL='http://configured.example.com/')
+        self.assertEqual(models.BASE_API_URL + 'x/', 'http://configured.example.com/x/')
+        self.assertEqual('%sx/' % models.BASE_API_URL, 'http://configured.example.com/x/')
+        self.assertEqual(OtherApiModel.url(), 'http://other.example.com/api/otherapimodels/')
+
+    def test_client(self):
+        pool = FakePool((200, {}, '{"id": 1, "name": "One"}'), (200, {}, '{"id": 1, "name": "One"}'),
+                        (200, {}, '{"id": 1, "name": "One"}'))
+        base = Client(base_url='http://tenant.example.com/api/', headers={'X-Tenant': 'acme'}, pool=pool,
+                      cache=MemoryCache())
+        self.assertRaises(AttributeError, setattr, base, 'token', 'abc')
+        tenant = base.with_token('abc')
+        self.assertTrue(tenant.pool is pool and tenant.cache is base.cache, 'Clients should share their components')
+        self.assertEqual(base.token, None, 'with_token should not change the client')
+
+        rs = CachedModel.objects.using(tenant)
+        self.assertEqual(rs.get(pk=1).name, 'One')
+        method, url, kwargs = pool.requests[0]
+        self.assertEqual(url, 'http://tenant.example.com/api/testmodels/1/')
+        self.assertEqual((kwargs['headers']['AUTHORIZATION'], kwargs['headers']['X-Tenant']), ('JWT abc', 'acme'))
+
+        rs.get(pk=1, token='other')
+        self.assertEqual(pool.requests[1][2]['headers']['AUTHORIZATION'], 'JWT other',
+                         'A token given to a call should be used for it')
+        self.assertEqual(rs.client.token, 'abc', 'A token given to a call should not change the set')
+        rs.get(pk=1)
+        self.assertEqual(len(pool.requests), 2, 'The cached response should be used for the same client')
+        CachedModel.objects.using(base.replace(headers={'X-Tenant': 'other'})).get(pk=1)
+        self.assertEqual(len(pool.requests), 3, 'Clients with other headers should not share cache entries')
+
     def test_404(self):
         self.patcher.start()
         self.assertRaises(NotFoundException, TestModel.objects.get, pk=10)
@@ -143,6 +1007,36 @@ class ApiClientTestCase(unittest.TestCase):
         m.save()
         """
 
+    def test_session_pool(self):
+        self.patcher.start()
+        pool = SessionPool()
+        rs = TestModel.objects.all()
+        rs._pool = pool
+        len(rs)
+        rs._clone().get(pk=1)
+        stats = pool.get_stats()
+        self.assertEqual(stats['requests'], 2, 'Pool should have sent 2 requests, sent %s' % stats['requests'])
+        self.assertEqual(stats['waits'], 2, 'Pool should have handed out 2 connections, got %s' % stats['waits'])
+        self.assertTrue(pool.get_session(BASE_API_URL) is pool.get_session(BASE_API_URL + 'testmodels/'),
+                        'Requests to the same host should share a session')
+
+        pool = SessionPool(scope=THREAD_SCOPE)
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(pool.get_session(BASE_API_URL)))
+        thread.start()
+        thread.join()
+        self.assertFalse(sessions[0] is pool.get_session(BASE_API_URL),
+                         'Thread scoped pools should not share sessions between threads')
+
+        threads = [threading.Thread(target=pool.request, args=('get', BASE_API_URL + 'testmodels/response.json'))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        stats = pool.get_stats()
+        self.assertEqual(len(pool._adapters), 1, 'Sessions of exited threads should be closed, %s left' % len(pool._adapters))
+        self.assertEqual((stats['requests'], stats['open']), (3, 0), 'Closed sessions should count but hold nothing, got %s' % stats)
+
     def test_delete(self):
         pass
 